@@ -0,0 +1,295 @@
+#-------------------------------------------------------------------------------
+# Name:        RPTR benchmark
+# Purpose:     Catch slow bullets and slow parsers before they are deployed
+#
+# Author:      John de Kroon
+#
+# Created:     18-10-2026
+# Copyright:   (c) John de Kroon 2016
+# Version:     1.0
+#-------------------------------------------------------------------------------
+
+import argparse
+import os
+import sys
+import json
+import time
+import random
+import tempfile
+import sre_parse
+import sre_constants
+
+import core.report
+from core.clip import *
+from core.report import *
+from core.armory import *
+from core.fixtures import *
+from core.profiler import monotonic
+
+import conf
+
+parser = argparse.ArgumentParser(prog='benchmark.py', formatter_class=argparse.RawDescriptionHelpFormatter, description="""Benchmark of the clip/loot pipeline and the nmap parser
+Recorded output from the fixtures dir is replayed, bullets without a fixture get synthetic output.
+No database or tools are needed, but MySQLdb must be installed: the clips import the database module.
+
+Example: benchmark.py --sizes 10,1000,100000 --baseline benchmark.json""")
+parser.add_argument('-b', help="Bullet files to benchmark, comma separated (default: all)")
+parser.add_argument('--sizes', default="10,1000,10000", help="Output sizes in KB, comma separated")
+parser.add_argument('--hosts', default="256,4096", help="Number of hosts in the nmap xml, comma separated")
+parser.add_argument('--repeat', type=int, default=3, help="Run every case this many times, the fastest run counts")
+parser.add_argument('--baseline', help="Compare with the results in this file")
+parser.add_argument('--save-baseline', help="Save the results in this file")
+parser.add_argument('--tolerance', type=float, default=0.25, help="A case is a regression when it is this much slower than the baseline (0.25 is 25%%)")
+parser.add_argument('--record', type=int, help="Save the tool output of a scan in the fixtures dir and stop. Needs the database. The xml of the portscan is saved by rptr.py --record-portscan")
+
+#lines around the findings in synthetic output
+FILLER = "+ OSVDB-0: GET /benchmark/%d: nothing to see here, move along. Server: Apache/2.4.1 (Unix)\n"
+
+class MemoryDbmanager():
+    'keeps everything in memory, so the pipeline runs without a database'
+
+    def __init__(self):
+        self.tool_logs = []
+        self.vulnerabilities = []
+
+    def tool_log_create(self, id_scan, tool, exec_time, output, status = "done", exit_code = None, cache_key = None, port = None):
+        self.tool_logs.append((id_scan, tool, exec_time, len(output), status, exit_code, cache_key, port))
+        return len(self.tool_logs)
+
+    def vulnerability_create(self, id_scan, id_tool_log, id_template, proof):
+        self.vulnerabilities.append((id_scan, id_tool_log, id_template, proof))
+
+    def vulnerability_create_many(self, rows):
+        self.vulnerabilities.extend(rows)
+        return len(rows)
+
+    def test_get(self, id):
+        return []
+
+#build a string the regex matches, returns None for patterns that are too hard
+def sample(regex):
+    try:
+        text = sample_parsed(sre_parse.parse(regex.pattern, regex.flags))
+    except (ValueError, KeyError, TypeError, sre_constants.error):
+        return None
+    if regex.search(text) is None:
+        return None
+    return text
+
+def sample_parsed(parsed):
+    text = ""
+    for op, av in parsed:
+        if op == sre_constants.LITERAL:
+            text += chr(av)
+        elif op == sre_constants.NOT_LITERAL:
+            text += "x" if av != ord("x") else "y"
+        elif op == sre_constants.ANY:
+            text += "x"
+        elif op == sre_constants.IN:
+            text += sample_in(av)
+        elif op in (sre_constants.MAX_REPEAT, sre_constants.MIN_REPEAT):
+            low, high, item = av
+            text += sample_parsed(item) * max(low, 1 if high > 0 else 0)
+        elif op == sre_constants.SUBPATTERN:
+            text += sample_parsed(av[-1])
+        elif op == sre_constants.BRANCH:
+            text += sample_parsed(av[1][0])
+        elif op == sre_constants.AT:
+            continue
+        else:
+            raise ValueError(op)
+    return text
+
+def sample_in(items):
+    for op, av in items:
+        if op == sre_constants.LITERAL:
+            return chr(av)
+        if op == sre_constants.RANGE:
+            return chr(av[0])
+        if op == sre_constants.CATEGORY:
+            return {sre_constants.CATEGORY_DIGIT: "0", sre_constants.CATEGORY_WORD: "a", sre_constants.CATEGORY_SPACE: " "}.get(av, "x")
+        if op == sre_constants.NEGATE:
+            return "x"
+    raise ValueError(items)
+
+#output of a bullet of the given size, the findings are at the end (the worst case for the regexes)
+def build_output(bullet_file, index, bullet, size):
+    path = get_fixture(bullet_file, index, bullet.execute)
+    if path is not None:
+        with open(path, "rb") as f:
+            recorded = f.read()
+        if len(recorded) == 0:
+            return ""
+        #repeat the recorded output until it has the size
+        return recorded * max(1, size // len(recorded))
+    hits = ""
+    for loot in bullet.loots:
+        text = sample(loot.regex)
+        if text is not None:
+            hits += text + "\n"
+    lines = []
+    length = len(hits)
+    x = 0
+    while length < size:
+        line = FILLER % x
+        lines.append(line)
+        length += len(line)
+        x += 1
+    lines.append(hits)
+    return "".join(lines)
+
+def build_nmap_xml(file_name, hosts):
+    with open(file_name, "w") as f:
+        f.write('<?xml version="1.0"?>\n<nmaprun scanner="nmap" args="nmap --open -sV">\n')
+        for x in range(0, hosts):
+            f.write('<host><status state="up"/><address addr="10.%d.%d.%d" addrtype="ipv4"/><hostnames/><ports><extraports state="closed" count="996"/>' % (x // 65536 % 256, x // 256 % 256, x % 256))
+            f.write('<port protocol="tcp" portid="22"><state state="open" reason="syn-ack"/><service name="ssh" product="OpenSSH" version="7.4" method="probed"/></port>')
+            f.write('<port protocol="tcp" portid="80"><state state="open" reason="syn-ack"/><service name="http" product="Apache httpd" version="2.4.6" method="probed"/></port>')
+            f.write('<port protocol="tcp" portid="443"><state state="open" reason="syn-ack"/><service name="http" product="nginx" tunnel="ssl" method="probed"/></port>')
+            f.write('<port protocol="tcp" portid="3306"><state state="open" reason="syn-ack"/><service name="mysql" product="MySQL" method="probed"/></port>')
+            f.write('</ports></host>\n')
+        f.write('</nmaprun>\n')
+
+#run the bullets of a file on outputs of size bytes
+def bench_clip(bullet_file, size, repeat):
+    magazine = get_magazine(bullet_file)
+    outputs = [{'id': x, 'output': build_output(bullet_file, x, magazine.bullets[x], size)} for x in range(0, len(magazine.bullets))]
+    total = sum(len(output['output']) for output in outputs)
+    best = None
+    report = Report()
+    for x in range(0, repeat):
+        start = monotonic()
+        clip = Clip(os.path.splitext(bullet_file)[0])
+        clip.setSavePath("/tmp/benchmark")
+        clip.setPort("80")
+        clip.read_bullet("'benchmark.example'")
+        results = clip.process_results(outputs)
+        merged = report.merge_lists([results])
+        duration = monotonic() - start
+        if best is None or duration < best:
+            best = duration
+    found = sorted(result['id'] for result in merged)
+    return {'seconds': best, 'bytes': total, 'results': found}
+
+#parse nmap xml with hosts hosts
+def bench_parse(hosts, repeat):
+    #imported here, so the other benchmarks run without lxml
+    from core.portscan import iter_ports
+    fixture = conf.get_config('fixtures_dir') + "nmap.xml"
+    file_name = tempfile.mktemp(prefix="rptr-benchmark-", suffix=".xml")
+    try:
+        if os.path.isfile(fixture):
+            #the hosts of the recorded scan, copied until there are enough
+            with open(fixture) as f:
+                recorded = f.read()
+            body = recorded[recorded.index("<host"):recorded.rindex("</host>") + 7]
+            with open(file_name, "w") as f:
+                f.write(recorded[:recorded.index("<host")])
+                for x in range(0, max(1, hosts // max(1, body.count("<host")))):
+                    f.write(body)
+                f.write(recorded[recorded.rindex("</host>") + 7:])
+        else:
+            build_nmap_xml(file_name, hosts)
+        total = os.path.getsize(file_name)
+        best = None
+        for x in range(0, repeat):
+            start = monotonic()
+            count = 0
+            for port in iter_ports(file_name):
+                count += 1
+            duration = monotonic() - start
+            if best is None or duration < best:
+                best = duration
+    finally:
+        if os.path.exists(file_name):
+            os.remove(file_name)
+    return {'seconds': best, 'bytes': total, 'results': count}
+
+#run a case in a child process, so its peak memory can be measured
+def run_case(function, args):
+    read_end, write_end = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        os.close(read_end)
+        try:
+            result = function(*args)
+        except Exception as e:
+            result = {'error': str(e)}
+        with os.fdopen(write_end, "w") as f:
+            json.dump(result, f)
+        os._exit(0)
+    os.close(write_end)
+    with os.fdopen(read_end) as f:
+        data = f.read()
+    pid, status, rusage = os.wait4(pid, 0)
+    try:
+        result = json.loads(data)
+    except ValueError:
+        result = {'error': "the benchmark crashed (exit status "+str(status)+")"}
+    #kilobytes on linux
+    result['peak_kb'] = rusage.ru_maxrss
+    return result
+
+def get_cases(args):
+    cases = []
+    if args.b:
+        bullet_files = [name.strip() + ".xml" for name in args.b.split(",")]
+    else:
+        bullet_files = sorted(name for name in os.listdir(conf.get_config('bullets_dir')) if name.endswith(".xml"))
+    for bullet_file in bullet_files:
+        if get_magazine(bullet_file) is None:
+            continue
+        for size in args.sizes.split(","):
+            cases.append(("clip " + bullet_file + " " + size.strip() + "KB", bench_clip, (bullet_file, int(size) * 1024, args.repeat)))
+    for hosts in args.hosts.split(","):
+        cases.append(("parse nmap " + hosts.strip() + " hosts", bench_parse, (int(hosts), args.repeat)))
+    return cases
+
+def compare(name, result, baseline, tolerance):
+    if name not in baseline:
+        return "new"
+    old = baseline[name]
+    if old.get('results') != result.get('results'):
+        return "RESULTS CHANGED"
+    if result['seconds'] > old['seconds'] * (1 + tolerance) and result['seconds'] - old['seconds'] > 0.001:
+        return "SLOWER (%+.0f%%)" % ((result['seconds'] / old['seconds'] - 1) * 100)
+    return "ok (%+.0f%%)" % ((result['seconds'] / max(old['seconds'], 0.000001) - 1) * 100)
+
+def main():
+    args = parser.parse_args()
+    if args.record:
+        for path in record(args.record):
+            print "Saved "+path
+        return 0
+    #the report doesn't need the database for merging
+    core.report.Dbmanager = MemoryDbmanager
+    baseline = {}
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    results = {}
+    failed = False
+    print "%-40s %10s %10s %12s %10s  %s" % ("case", "MB", "seconds", "MB/s", "peak MB", "baseline")
+    for name, function, function_args in get_cases(args):
+        result = run_case(function, function_args)
+        if 'error' in result:
+            print "%-40s error: %s" % (name, result['error'])
+            failed = True
+            continue
+        results[name] = result
+        mb = result['bytes'] / 1048576.0
+        state = ""
+        if args.baseline:
+            state = compare(name, result, baseline, args.tolerance)
+            if state == "RESULTS CHANGED" or state.startswith("SLOWER"):
+                failed = True
+        print "%-40s %10.1f %10.4f %12.1f %10.1f  %s" % (name, mb, result['seconds'], mb / max(result['seconds'], 0.000001), result['peak_kb'] / 1024.0, state)
+    if args.save_baseline:
+        with open(args.save_baseline, "w") as f:
+            json.dump(results, f, indent=1, sort_keys=True)
+    if failed:
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -4,22 +4,136 @@ import os
 config = {}
 
 config['default_template'] = "nl_template.xml"
+#template files that are searched when the template of a finding is not in the selected template file
+config['fallback_templates'] = []
 config['bullets_dir'] = os.path.dirname(os.path.realpath(__file__))+"/bullets/"
 config['plugins_dir'] = os.path.dirname(os.path.realpath(__file__))+"/plugins/"
 config['templates_dir'] = os.path.dirname(os.path.realpath(__file__))+"/templates/"
+config['migrations_dir'] = os.path.dirname(os.path.realpath(__file__))+"/migrations/"
 
 #default bullets
 #xml bullet file in the bullets dir, WITHOUT the .xml extension
+#for the mass bullets, Default means a portscan and the bullets of the services that are found
 config['default_bullet'] = ""
 config['mass_bullet_day'] = ""
 config['mass_bullet_week'] = ""
 config['mass_bullet_month'] = ""
 
+#concurrency
+#maximum number of bullets (tools) that run at the same time, for all scans together
+config['max_bullets'] = 8
+#maximum number of bullets per tool that run at the same time. Example: {'nikto': 2}
+config['tool_limits'] = {'nikto': 2}
+
+#timeouts
+#default timeout (in seconds) of a bullet, a bullet can set its own with <bullet timeout="600">. None means no timeout
+config['bullet_timeout'] = 2*60*60
+#timeout (in seconds) of the portscan
+config['portscan_timeout'] = 60*60
+#seconds between asking a tool to stop (SIGTERM) and killing it (SIGKILL)
+config['kill_grace'] = 5
+
+#portscan profiles, select one with --portscan [name]
+#ports and timing are nmap options. A staged profile first sweeps the ports without -sV and then
+#runs -sV on the open ports only, in batches of at most batch ports while the sweep is still running
+config['portscan_profile'] = "default"
+config['portscan_profiles'] = {
+    'default': {'staged': False, 'ports': "--top-ports=50", 'timing': ""},
+    'top1000': {'staged': True, 'ports': "--top-ports=1000", 'timing': "-T4", 'batch': 20},
+    'full': {'staged': True, 'ports': "-p-", 'timing': "-T4 --min-rate=1000", 'batch': 20},
+}
+
+#targets (hosts or ranges like 10.0.0.0/24) that share one portscan, the hosts that are found get their own scan
+config['portscan_hosts'] = 256
+
+#seconds to wait for a web page when checking if http and https serve the same site
+config['http_probe_timeout'] = 10
+#pages that are more alike than this (0-1) are the same site
+config['http_similarity'] = 0.75
+
+#reuse the output of bullets with a ttl (<bullet ttl="86400">) that ran recently
+config['cache'] = True
+
+#incremental scans: skip services that didn't change since the previous scan of the target
+config['incremental'] = False
+#a service is scanned again when its findings are older than this (in seconds)
+config['incremental_max_age'] = 30*24*60*60
+
+#tool output
+#output larger than this (in bytes) is written to a temp file instead of kept in memory
+config['output_memory_limit'] = 1024*1024
+#output larger than this (in bytes) is cut off, None means no limit
+config['max_output_size'] = 256*1024*1024
+#maximum output size per tool. Example: {'nikto': 64*1024*1024}
+config['tool_output_limits'] = {}
+
+#mass scan daemon (rptr.py --mass-daemon)
+#number of targets that are scanned at the same time
+config['mass_parallel'] = 4
+#seconds between checks for due scans
+config['mass_poll'] = 60
+#seconds between checks for new targets
+config['mass_plan_interval'] = 60*60
+#the scans of a period are spread over this many seconds from the start of the period (UTC)
+config['mass_window'] = {'day': 20*60*60, 'week': 6*24*60*60, 'month': 25*24*60*60}
+
+#distributed workers (rptr.py --worker)
+#number of targets a worker scans at the same time
+config['worker_parallel'] = 4
+#seconds between checks for new jobs
+config['worker_poll'] = 10
+#seconds a job stays claimed without a heartbeat, after that it is queued again
+config['worker_lease'] = 5*60
+#a job that is claimed this many times is marked as failed
+config['worker_max_attempts'] = 3
+
+#profiling (rptr.py --profile and --trace [file])
+config['profile'] = False
+#write a chrome trace of the scan to this file, None means no trace
+config['trace_file'] = None
+#number of lines per category in the profile summary
+config['profile_top'] = 10
+#the trace keeps the newest events only, so a daemon or worker doesn't fill the memory
+#the summary counts every event
+config['trace_max_events'] = 100000
+
+#recorded tool output, for benchmark.py and the replay mode
+config['fixtures_dir'] = os.path.dirname(os.path.realpath(__file__))+"/fixtures/"
+#save the xml of the service detection as fixtures/nmap.xml (rptr.py --record-portscan)
+#the last run wins, use a profile that isn't staged to get every port in one file
+config['record_portscan'] = False
+#replay mode (rptr.py --replay): the tools are not run, their output is read from the fixtures dir
+config['replay'] = False
+#seconds (minimum, maximum) a replayed tool takes
+config['replay_latency'] = (0.5, 2.0)
+#latency per tool. Example: {'nikto': (30, 60)}
+config['replay_tool_latency'] = {}
+
 #db creds
+#the workers on other hosts need a database host they can reach
+config['db_host'] = "localhost"
 config['db_user'] = ""
 config['db_pass'] = ""
 config['db_name'] = ""
+#maximum number of database connections, shared by all threads
+config['db_pool_size'] = 10
+#idle connections are checked (pinged) before use after this many seconds
+config['db_pool_check'] = 30
+#zlib level (1-9) for the stored tool output
+config['output_compress_level'] = 6
+#buffer vulnerabilities and write them in batches, also across scans
+#the report at the end of a scan is then printed from memory, -r reads the database
+config['db_write_behind'] = False
+#the buffer is written when it holds this many rows, or when the oldest row is this many seconds old
+config['db_flush_size'] = 500
+config['db_flush_interval'] = 5
+#a batch that failed this many times is written row by row, rows that still fail are logged and dropped
+config['db_flush_retries'] = 3
 
 def get_config(key):
     global config
-    return config[key]
\ No newline at end of file
+    return config[key]
+
+def set_config(key, value):
+    global config
+    config[key] = value
\ No newline at end of file
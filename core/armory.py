@@ -0,0 +1,180 @@
+#-------------------------------------------------------------------------------
+# Name:        RPTR armory
+# Purpose:     Keeps the bullets loaded
+#
+# Author:      John de Kroon
+#
+# Created:     18-10-2026
+# Copyright:   (c) John de Kroon 2016
+# Version:     1.0
+#-------------------------------------------------------------------------------
+
+import os
+import re
+import threading
+import xml.etree.ElementTree as ET
+from collections import namedtuple
+import conf
+from scope import Scope
+
+#compiled (read only) form of a bullet file. These are shared between all clips,
+#so never change them after they are created
+Magazine = namedtuple('Magazine', ['name', 'mtime', 'bullets', 'result_list_size'])
+Bullet = namedtuple('Bullet', ['execute', 'loots', 'scope', 'timeout', 'ttl', 'after'])
+Loot = namedtuple('Loot', ['regex', 'execute', 'results'])
+Result = namedtuple('Result', ['id', 'description'])
+
+class BulletError(Exception):
+    pass
+
+class Armory():
+    'reads every bullet file once and keeps it loaded'
+
+    def __init__(self, bullets_dir = None):
+        if bullets_dir == None:
+            bullets_dir = conf.get_config('bullets_dir')
+        self.bullets_dir = bullets_dir
+        self.magazines = {}
+        self.loaded = False
+        self.lock = threading.Lock()
+
+    #load and validate all bullet files in the bullets dir
+    def load(self):
+        with self.lock:
+            for file_name in sorted(os.listdir(self.bullets_dir)):
+                if file_name.endswith(".xml"):
+                    self.reload(file_name)
+            self.loaded = True
+
+    #get the compiled bullet file, returns None if the file is invalid or not found
+    def get(self, file_name):
+        if not self.loaded:
+            self.load()
+        with self.lock:
+            try:
+                mtime = os.stat(self.bullets_dir + file_name).st_mtime
+            except OSError:
+                self.magazines.pop(file_name, None)
+                return None
+            magazine = self.magazines.get(file_name)
+            #the file changed on disk (or was never seen), read it again
+            if magazine is None or magazine.mtime != mtime:
+                magazine = self.reload(file_name)
+            return magazine
+
+    def reload(self, file_name):
+        try:
+            magazine = self.compile(file_name)
+        except BulletError as e:
+            print " ! Warning: the bullet "+file_name+" is invalid: "+str(e)
+            magazine = None
+        if magazine is None:
+            self.magazines.pop(file_name, None)
+        else:
+            self.magazines[file_name] = magazine
+        return magazine
+
+    def compile(self, file_name):
+        path = self.bullets_dir + file_name
+        try:
+            mtime = os.stat(path).st_mtime
+            bullets_xml = ET.parse(path).getroot()
+        #ElementTree can't read the file. The file is unreadable or the XML is corrupt
+        except (IOError, OSError, ET.ParseError) as e:
+            raise BulletError(str(e))
+
+        bullets = []
+        size = 0
+        for bullet in bullets_xml:
+            execute = self.saveFind(bullet, 'execute')
+            if execute is None:
+                raise BulletError("bullet without execute")
+            #timeout in seconds, None means the default timeout
+            timeout = self.saveInt(bullet, 'timeout')
+            #the output can be reused for this many seconds, None means never
+            ttl = self.saveInt(bullet, 'ttl')
+            #the bullet starts when these bullets are finished, <bullet after="0,1">
+            after = self.saveAfter(bullet, len(bullets))
+            loots = []
+            for loot in self.children(bullet, 'loots'):
+                regex = self.saveFind(loot, 'regex')
+                if regex is None:
+                    raise BulletError("loot without regex in '"+execute+"'")
+                try:
+                    regex = re.compile(regex)
+                except re.error as e:
+                    raise BulletError("invalid regex '"+regex+"': "+str(e))
+                results = []
+                for result in self.children(loot, 'results'):
+                    id = result.find('id')
+                    #results without an id can't be reported, skip them
+                    if id is None:
+                        continue
+                    try:
+                        id = int(id.text)
+                    except (TypeError, ValueError):
+                        raise BulletError("invalid result id '"+str(id.text)+"'")
+                    if id > size:
+                        size = id
+                    results.append(Result(id, self.saveFind(result, 'description')))
+                loots.append(Loot(regex, self.saveFind(loot, 'execute'), tuple(results)))
+            loots = tuple(loots)
+            bullets.append(Bullet(execute, loots, Scope(loots), timeout, ttl, after))
+        return Magazine(file_name, mtime, tuple(bullets), size+1)
+
+    #read a number from an attribute of the element
+    def saveInt(self, element, attribute):
+        value = element.get(attribute)
+        if value is None:
+            return None
+        try:
+            return int(value)
+        except ValueError:
+            raise BulletError("invalid "+attribute+" '"+value+"'")
+
+    #read the indexes of the bullets a bullet waits for, only earlier bullets
+    #are allowed so the bullets of a file can never wait for each other
+    def saveAfter(self, element, index):
+        value = element.get('after')
+        if value is None or value.strip() == "":
+            return ()
+        after = []
+        for part in value.split(","):
+            try:
+                x = int(part)
+            except ValueError:
+                raise BulletError("invalid after '"+value+"'")
+            if x < 0 or x >= index:
+                raise BulletError("after '"+value+"' must name earlier bullets of the file")
+            after.append(x)
+        return tuple(after)
+
+    def children(self, haystack, needle):
+        needleObj = haystack.find(needle)
+        if needleObj is None:
+            return []
+        return list(needleObj)
+
+    def saveFind(self, haystack, needle):
+        needleObj = haystack.find(needle)
+        return self.saveText(needleObj)
+
+    def saveText(self, obj):
+        result = None
+        if obj is not None:
+            result = str(obj.text)
+        return result
+
+#one armory per process
+armory = None
+armory_lock = threading.Lock()
+
+def get_armory():
+    global armory
+    with armory_lock:
+        if armory is None:
+            armory = Armory()
+    return armory
+
+def get_magazine(file_name):
+    return get_armory().get(file_name)
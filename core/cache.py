@@ -0,0 +1,41 @@
+#-------------------------------------------------------------------------------
+# Name:        RPTR cache
+# Purpose:     Don't fire the same bullet twice
+#
+# Author:      John de Kroon
+#
+# Created:     18-10-2026
+# Copyright:   (c) John de Kroon 2016
+# Version:     1.0
+#-------------------------------------------------------------------------------
+
+import conf
+from dbmanager import *
+
+#the temp dir is different for every scan, so it is not part of the key
+def get_cache_key(command, save_path):
+    if save_path:
+        command = command.replace(save_path, "[save_path]")
+    return hash_tool(command)
+
+class Cache():
+    'reuses the output of bullets that ran recently'
+
+    def __init__(self, id_scan, save_path):
+        self.id_scan = id_scan
+        self.save_path = save_path
+        self.dbmanager = Dbmanager()
+
+    #get the result of a recent run of the command, or None
+    #ttl is the maximum age in seconds, bullets without a ttl are never cached
+    def get(self, command, ttl, port = None):
+        if not ttl or not conf.get_config('cache'):
+            return None
+        key = get_cache_key(command, self.save_path)
+        row = self.dbmanager.tool_log_cache_get(key, ttl)
+        if row is None:
+            return None
+        id_cached, output_hash, output_size, output = row
+        #log the hit in this scan, it refers to the output that is already stored
+        id_tool_log = self.dbmanager.tool_log_cache_create(self.id_scan, command, key, output_hash, output_size, port)
+        return {'id': id_tool_log, 'output': output, 'exec_time': "00:00:00", 'duration': 0, 'returncode': None, 'status': "cached", 'size': len(output), 'truncated': False}
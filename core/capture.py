@@ -0,0 +1,93 @@
+#-------------------------------------------------------------------------------
+# Name:        RPTR capture
+# Purpose:     Catch the output of a tool
+#
+# Author:      John de Kroon
+#
+# Created:     18-10-2026
+# Copyright:   (c) John de Kroon 2016
+# Version:     1.0
+#-------------------------------------------------------------------------------
+
+import os
+import mmap
+import tempfile
+
+#bytes read from the tool at once
+CHUNK_SIZE = 65536
+
+class Capture():
+    'reads tool output in chunks, large output is moved to a temp file'
+
+    def __init__(self, max_memory, max_size = None):
+        #output larger than max_memory is written to a temp file
+        self.max_memory = max_memory
+        #output larger than max_size is cut off
+        self.max_size = max_size
+        self.chunks = []
+        self.file = None
+        self.map = None
+        self.size = 0
+        self.truncated = False
+
+    #read the stream until it is closed
+    def read_from(self, stream):
+        fd = stream.fileno()
+        while True:
+            chunk = os.read(fd, CHUNK_SIZE)
+            if not chunk:
+                break
+            self.write(chunk)
+
+    def write(self, chunk):
+        if self.max_size is not None and self.size + len(chunk) > self.max_size:
+            #keep reading (and dropping) the rest, otherwise the tool blocks on a full pipe
+            chunk = chunk[:max(0, self.max_size - self.size)]
+            self.truncated = True
+        if len(chunk) == 0:
+            return
+        self.size += len(chunk)
+        if self.file is None and self.size > self.max_memory:
+            self.spill()
+        if self.file is None:
+            self.chunks.append(chunk)
+        else:
+            self.file.write(chunk)
+
+    #move the output in memory to a temp file
+    def spill(self):
+        self.file = tempfile.TemporaryFile(prefix="rptr-")
+        for chunk in self.chunks:
+            self.file.write(chunk)
+        self.chunks = []
+
+    #get the output. Large output is returned as a read only mmap of the temp file,
+    #the re module and the database layer can use it like a string
+    def get_output(self):
+        if self.file is None:
+            if len(self.chunks) != 1:
+                self.chunks = ["".join(self.chunks)]
+            return self.chunks[0]
+        if self.map is None:
+            self.file.flush()
+            self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        return self.map
+
+    #get the output as a string, only use this for small output
+    def read(self):
+        return self.get_output()[:]
+
+    def get_size(self):
+        return self.size
+
+    def is_truncated(self):
+        return self.truncated
+
+    def close(self):
+        if self.map is not None:
+            self.map.close()
+            self.map = None
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+        self.chunks = []
@@ -10,17 +10,17 @@
 #-------------------------------------------------------------------------------
 
 import os
-import xml.etree.ElementTree as ET
 import conf
-import re
+from armory import get_magazine
+from profiler import get_profiler
+from rifle import get_tool_name
 
 class Clip():
     def __init__(self, bullet_file = None):
         #do something
         self.url = ""
         self.bullets = []
-        self.clips = []
-        self.bullets_xml = None
+        self.magazine = None
         self.port = None
         self.save_path = None
         self.bullets_dir = conf.get_config('bullets_dir')
@@ -33,16 +33,15 @@ class Clip():
     #read bullet file and extract bullets from it    
     def read_bullet(self, url):
         self.url = url
-        #try to read the bullet with ElementTree
-        try:
-            self.bullets_xml = ET.parse(self.bullets_dir + self.bullet_file).getroot()
-        #ElementTree can't read the file. The file is unreadable or the XML is corrupt
-        except:
+        #get the compiled bullet file from the armory, it is only parsed once per process
+        self.magazine = get_magazine(self.bullet_file)
+        #the armory can't read the file. The file is unreadable or the XML is corrupt
+        if self.magazine is None:
             print " ! Warning: the bullet "+self.bullet_file+" is invalid or not found"
             return False
         #loop through bullets and add it to the bullet list
-        for bullet in self.bullets_xml:
-            self.bullets.append(self.prepare_bullet(bullet.find('execute').text))
+        for bullet in self.magazine.bullets:
+            self.bullets.append(self.prepare_bullet(bullet.execute))
     
     #replace placeholders with actual data
     def prepare_bullet(self, bullet):
@@ -57,43 +56,55 @@ class Clip():
     def get_bullets(self):
         return self.bullets
     
-    def get_clips(self):
-        return self.clips
+    #timeout in seconds of the bullet at index x
+    def get_timeout(self, x):
+        timeout = self.magazine.bullets[x].timeout
+        if timeout is None:
+            timeout = conf.get_config('bullet_timeout')
+        return timeout
     
-    def process_results(self, output):
-        item_count = len(output)
-        searchObj = None
-        self.result_list_size = self.getResultListSize(self.bullets_xml)
-        result_list = [None] * self.result_list_size
-        
-        for x in range(0, item_count):
-            output_item = output[x]
-            id_tool_log = output_item['id']
-            output_item = output_item ['output']
-            bullet = self.bullets_xml[x]
-            
-            loots = bullet.find('loots')
-            
-            for loot in loots:
-                regex = loot.find('regex').text
-                #print regex
-                searchObj = re.search(regex, output_item)
-                if searchObj:
-                    new_clip = self.saveFind(loot, 'execute')
-                    if new_clip is not None:
-                        self.clips.append(new_clip)
-                    results = loot.find('results')
-                    try:
-                        for result in results:
-                            id = result.find('id').text
-                            desc = self.saveFind(result, 'description')
-                            result_list.append({'id': id, 'desc': desc, 'id_tool_log': id_tool_log, 'match': searchObj.group(0), 'prove': output})
-                    except:
-                        continue
+    #seconds the output of the bullet at index x can be reused, None means never
+    def get_ttl(self, x):
+        return self.magazine.bullets[x].ttl
+    
+    #the indexes of the bullets the bullet at index x waits for
+    def get_after(self, x):
+        return self.magazine.bullets[x].after
+    
+    #match the loots of the bullet at index x on its output, so the clips of the
+    #loots can start before the other bullets of the clip are finished
+    #returns the results and the clips the loots start
+    def match_bullet(self, x, output_item):
+        id_tool_log = output_item['id']
+        output = output_item['output']
+        bullet = self.magazine.bullets[x]
+        results = []
+        clips = []
         
+        #the scope finds all loots of the bullet in one pass over the output
+        with get_profiler().span(get_tool_name(bullet.execute), "regex", bytes=len(output), loots=len(bullet.loots)):
+            matches = bullet.scope.scan(output)
+        for y in range(0, len(bullet.loots)):
+            loot = bullet.loots[y]
+            searchObj = matches[y]
+            if searchObj:
+                if loot.execute is not None:
+                    clips.append(loot.execute)
+                for result in loot.results:
+                    results.append({'id': result.id, 'desc': result.description, 'id_tool_log': id_tool_log, 'match': searchObj.group(0), 'prove': output_item})
+        return results, clips
+    
+    #match every bullet at once, the scheduler uses match_bullet instead
+    #this is kept for benchmark.py, the clips the loots start are not returned
+    def process_results(self, output):
+        result_list = []
+        for x in range(0, len(output)):
+            results, clips = self.match_bullet(x, output[x])
+            result_list.extend(results)
         return self.group_results(result_list)
     
     def group_results(self, result_list):
+        self.result_list_size = self.magazine.result_list_size
         resultGroupList = [None] * self.result_list_size
         for result in result_list:
             if result == None:
@@ -108,34 +119,6 @@ class Clip():
                 
         return resultGroupList
     
-    def saveFind(self, haystack, needle):
-        needleObj = haystack.find(needle)
-        return self.saveText(needleObj)
-
-    def saveText(self, obj):
-        result = None
-        if obj is not None:
-            result = str(obj.text)
-        return result
-    
-    #if someone knows a better way just send your pull request :)
-    def getResultListSize(self, bullets):
-        size = 0
-        for bullet in bullets:
-            loots = bullet.find('loots')
-            try:
-                for loot in loots:
-                    results = loot.find('results')
-                    for result in results:
-                        id = result.find('id')
-                        if id is not None:
-                            id = int(id.text)
-                            if id > size:
-                                size = id
-            except:
-                continue
-        return int(size)+1
-    
     def getBulletFile(self):
         return self.bullet_file
     
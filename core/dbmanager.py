@@ -10,104 +10,739 @@
 #-------------------------------------------------------------------------------
 
 import MySQLdb
+import MySQLdb.cursors
+import re
+import atexit
+import hashlib
+import struct
+import zlib
+import Queue
+import threading
+import sys
+import time
+from contextlib import contextmanager
 import conf
+from profiler import *
 
-class Dbmanager:
-    def __init__(self):
+#tool commands are too long for an index, tool_log.tool_hash holds the SHA1 of the command
+def hash_tool(tool):
+    return hashlib.sha1(tool).hexdigest()
+
+#targets are stored between quotes, the reversed target is stored without them
+#so a domain and its subdomains can be found with a prefix search
+def reverse_target(target):
+    return target.strip("'")[::-1]
+
+#tool output is stored compressed in tool_output, in the format of MySQL COMPRESS():
+#the uncompressed length (4 bytes, little endian) followed by the zlib data
+def compress_output(output):
+    if output is None or len(output) == 0:
+        return ""
+    return struct.pack("<I", len(output) & 0x3FFFFFFF) + zlib.compress(output, conf.get_config('output_compress_level'))
+
+def decompress_output(data):
+    if data is None or len(data) == 0:
+        return ""
+    return zlib.decompress(data[4:])
+
+def escape_like(text):
+    return text.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+#the WHERE clause and parameters that find a target in the scan table
+#a domain also finds its subdomains, which end with "."+domain, so example.com doesn't find badexample.com
+#an ip address only finds itself, 10.0.0.1 doesn't find 110.0.0.1
+def target_filter(target):
+    reversed_target = reverse_target(target)
+    if re.match(r"^[\d\.]+$|^[0-9a-fA-F:]*:[0-9a-fA-F:\.]*$", target.strip("'")):
+        return "scan.target_reversed = %s", [reversed_target]
+    return "(scan.target_reversed = %s OR scan.target_reversed LIKE %s)", [reversed_target, escape_like(reversed_target)+".%"]
+
+class Pool():
+    'shares a limited number of connections between all threads'
+
+    def __init__(self, size, check_after):
+        self.size = size
+        #connections that were idle longer than this (in seconds) are pinged before use
+        self.check_after = check_after
+        self.slots = threading.BoundedSemaphore(size)
+        #last in first out, so the fresh connections are reused and the old ones time out
+        self.idle = Queue.LifoQueue()
+
+    def connect(self):
         db_user = conf.get_config('db_user')
         db_pass = conf.get_config('db_pass')
         db_name = conf.get_config('db_name')
-        self.conn = MySQLdb.Connection("localhost",db_user,db_pass,db_name)
+        db_host = conf.get_config('db_host')
+        return MySQLdb.Connection(db_host,db_user,db_pass,db_name)
+
+    #borrow a connection, waits when all connections are in use
+    def get(self):
+        self.slots.acquire()
+        try:
+            while True:
+                try:
+                    conn, last_used = self.idle.get_nowait()
+                except Queue.Empty:
+                    return self.connect()
+                if time.time() - last_used < self.check_after or self.check(conn):
+                    return conn
+                self.discard(conn)
+        except:
+            self.slots.release()
+            raise
+
+    #return a borrowed connection, broken connections are closed instead
+    def put(self, conn, broken = False):
+        try:
+            if broken:
+                self.discard(conn)
+            else:
+                self.idle.put((conn, time.time()))
+        finally:
+            self.slots.release()
+
+    def check(self, conn):
+        try:
+            conn.ping()
+            return True
+        except MySQLdb.Error:
+            return False
+
+    def discard(self, conn):
+        try:
+            conn.close()
+        except MySQLdb.Error:
+            pass
+
+    #close all idle connections
+    def close(self):
+        while True:
+            try:
+                conn, last_used = self.idle.get_nowait()
+            except Queue.Empty:
+                break
+            self.discard(conn)
+
+#one pool per process
+pool = None
+pool_lock = threading.Lock()
+
+def get_pool():
+    global pool
+    with pool_lock:
+        if pool is None:
+            pool = Pool(conf.get_config('db_pool_size'), conf.get_config('db_pool_check'))
+    return pool
+
+class Writer():
+    'collects vulnerabilities and writes them in batches (write-behind)'
+
+    def __init__(self, flush_size, flush_interval, max_retries):
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        #failed flushes in a row, after max_retries the rows are written one by one
+        self.max_retries = max_retries
+        self.failures = 0
+        self.rows = []
+        #time the oldest row in the buffer was added
+        self.oldest = None
+        self.lock = threading.Lock()
+        #writes are done one at a time, so rows are stored in the order they were added
+        self.write_lock = threading.Lock()
+        self.dbmanager = Dbmanager()
+        t = threading.Thread(target=self.timer)
+        t.daemon = True
+        t.start()
+
+    def add(self, id_scan, id_tool_log, id_template, proof = None):
+        self.add_many([(id_scan, id_tool_log, id_template, proof)])
+
+    def add_many(self, rows):
+        with self.lock:
+            if self.oldest is None:
+                self.oldest = time.time()
+            self.rows.extend(rows)
+            full = len(self.rows) >= self.flush_size
+        if full:
+            self.flush()
+
+    #write all buffered rows
+    def flush(self):
+        with self.write_lock:
+            with self.lock:
+                rows = self.rows
+                self.rows = []
+                self.oldest = None
+            if len(rows) == 0:
+                return
+            try:
+                self.dbmanager.vulnerability_create_many(rows)
+                self.failures = 0
+            except Exception:
+                self.failures += 1
+                if self.failures < self.max_retries:
+                    #keep the rows, the next flush tries again
+                    with self.lock:
+                        self.rows[0:0] = rows
+                        if self.oldest is None:
+                            self.oldest = time.time()
+                    raise
+                #one bad row must not block the rows behind it, write them one by one
+                self.failures = 0
+                self.write_rows(rows)
+
+    #write rows on their own, the rows that fail are logged and dropped
+    def write_rows(self, rows):
+        for row in rows:
+            try:
+                self.dbmanager.vulnerability_create(*row)
+            except Exception as e:
+                print " ! Error: dropped vulnerability "+str(row[2])+" of scan #"+str(row[0])+": "+str(e)
+
+    #flush rows that are waiting too long, even if the buffer is not full
+    def timer(self):
+        while True:
+            time.sleep(1)
+            with self.lock:
+                late = self.oldest is not None and time.time() - self.oldest >= self.flush_interval
+            if late:
+                try:
+                    self.flush()
+                except Exception as e:
+                    print " ! Error: could not write vulnerabilities: "+str(e)
+
+#one writer per process
+writer = None
+writer_lock = threading.Lock()
+
+def get_writer():
+    global writer
+    with writer_lock:
+        if writer is None:
+            writer = Writer(conf.get_config('db_flush_size'), conf.get_config('db_flush_interval'), conf.get_config('db_flush_retries'))
+            #the rows that are still buffered are written when the process ends
+            atexit.register(flush_writer)
+    return writer
+
+def flush_writer():
+    with writer_lock:
+        current = writer
+    if current is None:
+        return
+    try:
+        current.flush()
+    except Exception as e:
+        print " ! Error: could not write vulnerabilities: "+str(e)
+
+class Dbmanager:
+    def __init__(self):
+        self.pool = get_pool()
+        
+    def __enter__(self):
+        return self
         
     def __exit__(self, exc_type, exc_value, traceback):
-        self.conn.close()
+        #connections go back to the pool after every query, nothing to close
+        return False
+    
+    #borrow a connection from the pool for the duration of a with block
+    @contextmanager
+    def connection(self):
+        profiler = get_profiler()
+        if profiler.enabled:
+            #the name of the method that runs the query (this generator, contextmanager, method)
+            name = sys._getframe(2).f_code.co_name
+        start = monotonic()
+        conn = self.pool.get()
+        wait = monotonic() - start
+        try:
+            yield conn
+        except MySQLdb.OperationalError:
+            #lost or broken connection, don't give it to the next thread
+            self.pool.put(conn, True)
+            raise
+        except:
+            self.release(conn)
+            raise
+        else:
+            self.release(conn)
+        finally:
+            if profiler.enabled:
+                profiler.add(name, "db", start, monotonic() - start, {'wait': int(wait * 1000000)})
+
+    def release(self, conn):
+        #end the transaction (a select starts one as well), otherwise the next
+        #thread reads from an old snapshot and misses rows of other connections
+        try:
+            conn.rollback()
+        except MySQLdb.Error:
+            self.pool.put(conn, True)
+            return
+        self.pool.put(conn)
     
     def test_create(self, name, id_mass, profile = None):
-        # prepare a cursor object using cursor() method
-        cursor = self.conn.cursor()
-        cursor.execute("INSERT INTO `scan` (`target`, `id_mass`, `profile`)VALUES (%s, %s, %s);", (name, id_mass, profile))
-        id = cursor.lastrowid
-        cursor.close()
-        #commit insert
-        self.conn.commit()
+        with self.connection() as conn:
+            # prepare a cursor object using cursor() method
+            cursor = conn.cursor()
+            cursor.execute("INSERT INTO `scan` (`target`, `target_reversed`, `id_mass`, `profile`)VALUES (%s, %s, %s, %s);", (name, reverse_target(name), id_mass, profile))
+            id = cursor.lastrowid
+            cursor.close()
+            #commit insert
+            conn.commit()
         return id
     
     def test_get(self, id):
-        # prepare a cursor object using cursor() method
-        cursor = self.conn.cursor()
-        cursor.execute("SELECT target, id_template, tool_log.id as id_tool_log, proof, tool FROM `scan` JOIN vulnerabilities ON scan.id = vulnerabilities.id_scan JOIN tool_log ON vulnerabilities.id_tool_log = tool_log.id WHERE scan.id = %s", [id])
-        result = cursor.fetchall()
-        cursor.close()
+        with self.connection() as conn:
+            # prepare a cursor object using cursor() method
+            cursor = conn.cursor()
+            cursor.execute("SELECT target, id_template, tool_log.id as id_tool_log, proof, tool FROM `scan` JOIN vulnerabilities ON scan.id = vulnerabilities.id_scan JOIN tool_log ON vulnerabilities.id_tool_log = tool_log.id WHERE scan.id = %s", [id])
+            result = cursor.fetchall()
+            cursor.close()
         return result
     
+    #stream the findings of a scan or a mass scan, ordered by target
+    #target limits the findings to a domain and its subdomains, or to one ip address (see target_filter)
+    #target limits the findings to a domain and its subdomains
+    def report_rows_get(self, id_scan = None, id_mass = None, target = None, limit = None, offset = None):
+        sql = "SELECT target, id_template, tool_log.id as id_tool_log, proof, tool FROM `scan` JOIN vulnerabilities ON scan.id = vulnerabilities.id_scan JOIN tool_log ON vulnerabilities.id_tool_log = tool_log.id"
+        where = []
+        params = []
+        if id_scan is not None:
+            where.append("scan.id = %s")
+            params.append(id_scan)
+        if id_mass is not None:
+            where.append("scan.id_mass = %s")
+            params.append(id_mass)
+        if target is not None:
+            clause, clause_params = target_filter(target)
+            where.append(clause)
+            params.extend(clause_params)
+        if len(where) > 0:
+            sql += " WHERE " + " AND ".join(where)
+        #a fixed order, so the pages don't overlap
+        sql += " ORDER BY scan.target, vulnerabilities.id"
+        if limit is not None or offset is not None:
+            #MySQL only knows an offset together with a limit
+            if limit is None:
+                limit = 18446744073709551615
+            sql += " LIMIT %s OFFSET %s"
+            params.extend([limit, offset or 0])
+        with self.connection() as conn:
+            # prepare an unbuffered cursor, the rows stay on the server until they are fetched
+            cursor = conn.cursor(MySQLdb.cursors.SSCursor)
+            try:
+                cursor.execute(sql, params)
+                while True:
+                    row = cursor.fetchone()
+                    if row is None:
+                        break
+                    yield row
+            finally:
+                #reads the rows that are left, otherwise the connection can't be used again
+                cursor.close()
+    
     def test_list_domain(self, domain):
-        # prepare a cursor object using cursor() method
-        cursor = self.conn.cursor()
-        cursor.execute("SELECT * FROM `scan` WHERE target LIKE  %s", ["%"+domain+"%"])
-        result = cursor.fetchall()
-        cursor.close()
+        with self.connection() as conn:
+            # prepare a cursor object using cursor() method
+            cursor = conn.cursor()
+            if "*" in domain:
+                #a search for any text, * is any text (slow, every target is read)
+                cursor.execute("SELECT id, target, profile, exec_time, id_mass, timestamp FROM `scan` WHERE target LIKE %s ORDER BY id", ["%"+escape_like(domain).replace("*", "%")+"%"])
+            else:
+                #the domain and its subdomains or the ip address, this uses the index on the reversed target
+                clause, params = target_filter(domain)
+                cursor.execute("SELECT id, target, profile, exec_time, id_mass, timestamp FROM `scan` WHERE "+clause+" ORDER BY id", params)
+            result = cursor.fetchall()
+            cursor.close()
         return result
     
-    def test_update_time(self, id, time):
-        # prepare a cursor object using cursor() method
-        cursor = self.conn.cursor()
-        cursor.execute("UPDATE `scan` SET  `exec_time` =  %s WHERE  `id` = %s;", (time, id))
-        cursor.close()
-        #commit insert
-        self.conn.commit()
+    def test_update_time(self, id, time, status = "done"):
+        with self.connection() as conn:
+            # prepare a cursor object using cursor() method
+            cursor = conn.cursor()
+            cursor.execute("UPDATE `scan` SET  `exec_time` =  %s, `status` = %s WHERE  `id` = %s;", (time, status, id))
+            cursor.close()
+            #commit insert
+            conn.commit()
         return id
     
-    def tool_log_create(self, id_scan, tool, exec_time, output):
-        # prepare a cursor object using cursor() method
-        cursor = self.conn.cursor()
-        cursor.execute("INSERT INTO `rptr`.`tool_log` (`id_scan`, `tool`, `exec_time`, `output`) VALUES (%s, %s, %s, %s);", (id_scan, tool, exec_time, output))
-        id = cursor.lastrowid
-        cursor.close()
-        #commit insert
-        self.conn.commit()
+    #status is done, timeout (killed, output is partial) or truncated (output is cut off)
+    def tool_log_create(self, id_scan, tool, exec_time, output, status = "done", exit_code = None, cache_key = None, port = None):
+        with self.connection() as conn:
+            # prepare a cursor object using cursor() method
+            cursor = conn.cursor()
+            if output is None:
+                output = ""
+            #the output is stored once per content, the tool log only refers to it
+            output_hash = hashlib.sha1(output).hexdigest()
+            cursor.execute("INSERT IGNORE INTO `rptr`.`tool_output` (`hash`, `size`, `data`) VALUES (%s, %s, %s);", (output_hash, len(output), compress_output(output)))
+            cursor.execute("INSERT INTO `rptr`.`tool_log` (`id_scan`, `port`, `tool`, `tool_hash`, `cache_key`, `exec_time`, `output`, `output_hash`, `output_size`, `status`, `exit_code`) VALUES (%s, %s, %s, %s, %s, %s, '', %s, %s, %s, %s);", (id_scan, port, tool, hash_tool(tool), cache_key, exec_time, output_hash, len(output), status, exit_code))
+            id = cursor.lastrowid
+            cursor.close()
+            #commit insert
+            conn.commit()
+        return id
+    
+    #store output once, so many tool logs can refer to it, returns (hash, size)
+    def tool_output_create(self, output):
+        if output is None:
+            output = ""
+        output_hash = hashlib.sha1(output).hexdigest()
+        with self.connection() as conn:
+            # prepare a cursor object using cursor() method
+            cursor = conn.cursor()
+            cursor.execute("INSERT IGNORE INTO `rptr`.`tool_output` (`hash`, `size`, `data`) VALUES (%s, %s, %s);", (output_hash, len(output), compress_output(output)))
+            cursor.close()
+            #commit insert
+            conn.commit()
+        return output_hash, len(output)
+    
+    #log a tool run of which the output was stored with tool_output_create
+    def tool_log_shared_create(self, id_scan, tool, exec_time, output_hash, output_size, status = "done", exit_code = None, port = None):
+        with self.connection() as conn:
+            # prepare a cursor object using cursor() method
+            cursor = conn.cursor()
+            cursor.execute("INSERT INTO `rptr`.`tool_log` (`id_scan`, `port`, `tool`, `tool_hash`, `exec_time`, `output`, `output_hash`, `output_size`, `status`, `exit_code`) VALUES (%s, %s, %s, %s, %s, '', %s, %s, %s, %s);", (id_scan, port, tool, hash_tool(tool), exec_time, output_hash, output_size, status, exit_code))
+            id = cursor.lastrowid
+            cursor.close()
+            #commit insert
+            conn.commit()
+        return id
+    
+    #get the newest successful run of a command that is at most ttl seconds old
+    #returns (id, output_hash, output_size, output) or None
+    def tool_log_cache_get(self, cache_key, ttl):
+        with self.connection() as conn:
+            # prepare a cursor object using cursor() method
+            cursor = conn.cursor()
+            cursor.execute("SELECT tool_log.id, output_hash, output_size, data FROM `tool_log` JOIN `tool_output` ON tool_output.hash = tool_log.output_hash WHERE `cache_key` = %s AND `status` = 'done' AND tool_log.timestamp >= NOW() - INTERVAL %s SECOND ORDER BY tool_log.id DESC LIMIT 1", (cache_key, ttl))
+            result = cursor.fetchone()
+            cursor.close()
+        if result is None:
+            return None
+        return result[:3] + (decompress_output(result[3]),)
+    
+    #log a cache hit, the tool log refers to the output of the cached run
+    def tool_log_cache_create(self, id_scan, tool, cache_key, output_hash, output_size, port = None):
+        with self.connection() as conn:
+            # prepare a cursor object using cursor() method
+            cursor = conn.cursor()
+            cursor.execute("INSERT INTO `rptr`.`tool_log` (`id_scan`, `port`, `tool`, `tool_hash`, `cache_key`, `exec_time`, `output`, `output_hash`, `output_size`, `status`, `exit_code`) VALUES (%s, %s, %s, %s, %s, '00:00:00', '', %s, %s, 'cached', NULL);", (id_scan, port, tool, hash_tool(tool), cache_key, output_hash, output_size))
+            id = cursor.lastrowid
+            cursor.close()
+            #commit insert
+            conn.commit()
         return id
     
     def vulnerability_create(self, id_scan, id_tool_log, id_template, proof = None):
-        # prepare a cursor object using cursor() method
-        cursor = self.conn.cursor()
-        cursor.execute("INSERT INTO `rptr`.`vulnerabilities` (`id_scan`, `id_tool_log`, `id_template`, `proof`) VALUES (%s, %s, %s, %s);", (id_scan, id_tool_log, id_template, proof))
-        id = cursor.lastrowid
-        cursor.close()
-        #commit insert
-        self.conn.commit()
+        with self.connection() as conn:
+            # prepare a cursor object using cursor() method
+            cursor = conn.cursor()
+            cursor.execute("INSERT INTO `rptr`.`vulnerabilities` (`id_scan`, `id_tool_log`, `id_template`, `proof`) VALUES (%s, %s, %s, %s);", (id_scan, id_tool_log, id_template, proof))
+            id = cursor.lastrowid
+            cursor.close()
+            #commit insert
+            conn.commit()
         return id
     
+    #insert many vulnerabilities in one statement and one transaction
+    #rows is a list of (id_scan, id_tool_log, id_template, proof)
+    def vulnerability_create_many(self, rows):
+        if len(rows) == 0:
+            return 0
+        with self.connection() as conn:
+            # prepare a cursor object using cursor() method
+            cursor = conn.cursor()
+            cursor.executemany("INSERT INTO `rptr`.`vulnerabilities` (`id_scan`, `id_tool_log`, `id_template`, `proof`) VALUES (%s, %s, %s, %s);", rows)
+            count = cursor.rowcount
+            cursor.close()
+            #commit insert
+            conn.commit()
+        return count
+    
+    #the last finished scan of the target with the same profile, a failed scan misses findings
+    def scan_previous_get(self, target, profile, id_scan):
+        with self.connection() as conn:
+            # prepare a cursor object using cursor() method
+            cursor = conn.cursor()
+            cursor.execute("SELECT id FROM `scan` WHERE target_reversed = %s AND target = %s AND profile = %s AND exec_time IS NOT NULL AND status = 'done' AND id < %s ORDER BY id DESC LIMIT 1", (reverse_target(target), target, profile, id_scan))
+            result = cursor.fetchone()
+            cursor.close()
+        if result is None:
+            return None
+        return result[0]
+    
+    #returns (port, service, product, version, tunnel, duplicate, scanned, age in seconds)
+    def scan_ports_get(self, id_scan):
+        with self.connection() as conn:
+            # prepare a cursor object using cursor() method
+            cursor = conn.cursor()
+            cursor.execute("SELECT port, service, product, version, tunnel, duplicate, scanned, TIMESTAMPDIFF(SECOND, scanned, NOW()) FROM `scan_ports` WHERE id_scan = %s", [id_scan])
+            result = cursor.fetchall()
+            cursor.close()
+        return result
+    
+    #rows is a list of (port, service, product, version, tunnel, duplicate, scanned)
+    #scanned is the time the clips of the port ran, None means now
+    def scan_ports_create(self, id_scan, rows):
+        if len(rows) == 0:
+            return 0
+        with self.connection() as conn:
+            # prepare a cursor object using cursor() method
+            cursor = conn.cursor()
+            cursor.executemany("INSERT INTO `scan_ports` (`id_scan`, `port`, `service`, `product`, `version`, `tunnel`, `duplicate`, `scanned`) VALUES (%s, %s, %s, %s, %s, %s, %s, COALESCE(%s, NOW()));", [(id_scan,) + tuple(row) for row in rows])
+            count = cursor.rowcount
+            cursor.close()
+            #commit insert
+            conn.commit()
+        return count
+    
+    #copy the findings of a port from an earlier scan, they keep referring to the original tool log
+    def vulnerability_carry_forward(self, id_scan, id_previous, port):
+        with self.connection() as conn:
+            # prepare a cursor object using cursor() method
+            cursor = conn.cursor()
+            cursor.execute("INSERT INTO `rptr`.`vulnerabilities` (`id_scan`, `id_tool_log`, `id_template`, `proof`) SELECT %s, vulnerabilities.id_tool_log, vulnerabilities.id_template, vulnerabilities.proof FROM `vulnerabilities` JOIN `tool_log` ON vulnerabilities.id_tool_log = tool_log.id WHERE vulnerabilities.id_scan = %s AND tool_log.port = %s", (id_scan, id_previous, port))
+            count = cursor.rowcount
+            cursor.close()
+            #commit insert
+            conn.commit()
+        return count
+    
     def mass_get_targets(self):
-        # prepare a cursor object using cursor() method
-        cursor = self.conn.cursor()
-        cursor.execute("SELECT * from targets")
-        result = cursor.fetchall()
-        cursor.close()
+        with self.connection() as conn:
+            # prepare a cursor object using cursor() method
+            cursor = conn.cursor()
+            cursor.execute("SELECT * from targets")
+            result = cursor.fetchall()
+            cursor.close()
         return result
     
     def mass_create_log(self, type):
-        # prepare a cursor object using cursor() method
-        cursor = self.conn.cursor()
-        cursor.execute("INSERT INTO `mass` (`type`) VALUES (%s);", (type))
-        id = cursor.lastrowid
-        cursor.close()
-        #commit insert
-        self.conn.commit()
+        with self.connection() as conn:
+            # prepare a cursor object using cursor() method
+            cursor = conn.cursor()
+            cursor.execute("INSERT INTO `mass` (`type`) VALUES (%s);", (type))
+            id = cursor.lastrowid
+            cursor.close()
+            #commit insert
+            conn.commit()
+        return id
+    
+    #get the mass row of a type and period, it is created when it doesn't exist yet
+    def mass_period_get(self, type, period_start):
+        with self.connection() as conn:
+            # prepare a cursor object using cursor() method
+            cursor = conn.cursor()
+            cursor.execute("INSERT IGNORE INTO `mass` (`type`, `period_start`) VALUES (%s, %s);", (type, period_start))
+            cursor.execute("SELECT id FROM `mass` WHERE type = %s AND period_start = %s", (type, period_start))
+            id = cursor.fetchone()[0]
+            cursor.close()
+            #commit insert
+            conn.commit()
+        return id
+    
+    #rows is a list of (id_mass, id_target, bullet, due), targets that already have a job are skipped
+    def mass_jobs_plan(self, rows):
+        if len(rows) == 0:
+            return 0
+        with self.connection() as conn:
+            # prepare a cursor object using cursor() method
+            cursor = conn.cursor()
+            cursor.executemany("INSERT IGNORE INTO `mass_jobs` (`id_mass`, `id_target`, `bullet`, `due`) VALUES (%s, %s, %s, %s);", rows)
+            count = cursor.rowcount
+            cursor.close()
+            #commit insert
+            conn.commit()
+        return count
+    
+    #returns (id, target, bullet, id_mass) of queued jobs that are due
+    def mass_jobs_due(self, now, limit):
+        with self.connection() as conn:
+            # prepare a cursor object using cursor() method
+            cursor = conn.cursor()
+            cursor.execute("SELECT mass_jobs.id, targets.target, mass_jobs.bullet, mass_jobs.id_mass FROM `mass_jobs` JOIN `targets` ON targets.id = mass_jobs.id_target WHERE mass_jobs.state = 'queued' AND mass_jobs.due <= %s ORDER BY mass_jobs.due LIMIT %s", (now, limit))
+            result = cursor.fetchall()
+            cursor.close()
+        return result
+    
+    #mark a queued job as running, returns False if it is not queued anymore
+    def mass_job_start(self, id, now):
+        with self.connection() as conn:
+            # prepare a cursor object using cursor() method
+            cursor = conn.cursor()
+            cursor.execute("UPDATE `mass_jobs` SET `state` = 'running', `started` = %s WHERE `id` = %s AND `state` = 'queued';", (now, id))
+            count = cursor.rowcount
+            cursor.close()
+            #commit insert
+            conn.commit()
+        return count == 1
+    
+    def mass_job_finish(self, id, state, id_scan, now):
+        with self.connection() as conn:
+            # prepare a cursor object using cursor() method
+            cursor = conn.cursor()
+            cursor.execute("UPDATE `mass_jobs` SET `state` = %s, `id_scan` = %s, `finished` = %s WHERE `id` = %s;", (state, id_scan, now, id))
+            cursor.close()
+            #commit insert
+            conn.commit()
+        return id
+    
+    #jobs that were running when the daemon stopped are queued again
+    def mass_jobs_reset(self):
+        with self.connection() as conn:
+            # prepare a cursor object using cursor() method
+            cursor = conn.cursor()
+            cursor.execute("UPDATE `mass_jobs` SET `state` = 'queued', `started` = NULL WHERE `state` = 'running';")
+            count = cursor.rowcount
+            cursor.close()
+            #commit insert
+            conn.commit()
+        return count
+    
+    #rows is a list of (target, bullet, id_mass)
+    def job_create_many(self, rows):
+        if len(rows) == 0:
+            return 0
+        with self.connection() as conn:
+            # prepare a cursor object using cursor() method
+            cursor = conn.cursor()
+            cursor.executemany("INSERT INTO `jobs` (`target`, `bullet`, `id_mass`) VALUES (%s, %s, %s);", rows)
+            count = cursor.rowcount
+            cursor.close()
+            #commit insert
+            conn.commit()
+        return count
+    
+    #take the oldest queued job, returns (id, target, bullet, id_mass) or None
+    #the database clock is used for leases, so the clocks of the workers don't matter
+    def job_claim(self, worker, claim, lease):
+        with self.connection() as conn:
+            # prepare a cursor object using cursor() method
+            cursor = conn.cursor()
+            cursor.execute("UPDATE `jobs` SET `state` = 'running', `worker` = %s, `claim` = %s, `attempts` = `attempts` + 1, `started` = UTC_TIMESTAMP(), `heartbeat` = UTC_TIMESTAMP(), `lease_until` = UTC_TIMESTAMP() + INTERVAL %s SECOND WHERE `state` = 'queued' ORDER BY `id` LIMIT 1;", (worker, claim, lease))
+            count = cursor.rowcount
+            result = None
+            if count == 1:
+                cursor.execute("SELECT id, target, bullet, id_mass FROM `jobs` WHERE `claim` = %s", [claim])
+                result = cursor.fetchone()
+            cursor.close()
+            #commit insert
+            conn.commit()
+        return result
+    
+    #extend the lease of all running jobs of a worker
+    def job_heartbeat(self, worker, lease):
+        with self.connection() as conn:
+            # prepare a cursor object using cursor() method
+            cursor = conn.cursor()
+            cursor.execute("UPDATE `jobs` SET `heartbeat` = UTC_TIMESTAMP(), `lease_until` = UTC_TIMESTAMP() + INTERVAL %s SECOND WHERE `worker` = %s AND `state` = 'running';", (lease, worker))
+            count = cursor.rowcount
+            cursor.close()
+            #commit insert
+            conn.commit()
+        return count
+    
+    def job_finish(self, id, claim, state, id_scan):
+        with self.connection() as conn:
+            # prepare a cursor object using cursor() method
+            cursor = conn.cursor()
+            cursor.execute("UPDATE `jobs` SET `state` = %s, `id_scan` = %s, `finished` = UTC_TIMESTAMP() WHERE `id` = %s AND `claim` = %s;", (state, id_scan, id, claim))
+            cursor.close()
+            #commit insert
+            conn.commit()
         return id
     
+    #queue the jobs of workers that stopped sending heartbeats again
+    #jobs that were tried max_attempts times are marked as failed
+    def job_requeue_expired(self, max_attempts):
+        with self.connection() as conn:
+            # prepare a cursor object using cursor() method
+            cursor = conn.cursor()
+            cursor.execute("UPDATE `jobs` SET `state` = 'failed', `finished` = UTC_TIMESTAMP() WHERE `state` = 'running' AND `lease_until` < UTC_TIMESTAMP() AND `attempts` >= %s;", [max_attempts])
+            cursor.execute("UPDATE `jobs` SET `state` = 'queued', `worker` = NULL, `claim` = NULL WHERE `state` = 'running' AND `lease_until` < UTC_TIMESTAMP();")
+            count = cursor.rowcount
+            cursor.close()
+            #commit insert
+            conn.commit()
+        return count
+    
     def mass_get_report(self, id):
-        # prepare a cursor object using cursor() method
-        cursor = self.conn.cursor()
-        cursor.execute("SELECT target, id_template, tool_log.id as id_tool_log, proof, tool FROM `scan` JOIN vulnerabilities ON scan.id = vulnerabilities.id_scan JOIN tool_log ON vulnerabilities.id_tool_log = tool_log.id WHERE scan.id_mass = %s order by target", [id])
-        result = cursor.fetchall()
-        cursor.close()
+        with self.connection() as conn:
+            # prepare a cursor object using cursor() method
+            cursor = conn.cursor()
+            cursor.execute("SELECT target, id_template, tool_log.id as id_tool_log, proof, tool FROM `scan` JOIN vulnerabilities ON scan.id = vulnerabilities.id_scan JOIN tool_log ON vulnerabilities.id_tool_log = tool_log.id WHERE scan.id_mass = %s order by target", [id])
+            result = cursor.fetchall()
+            cursor.close()
         return result
     
     def hound_loot_get(self, id_test, bullet):
-        # prepare a cursor object using cursor() method
-        cursor = self.conn.cursor()
-        cursor.execute("SELECT * FROM  `tool_log` WHERE  `id_scan` = %s AND  `tool` = %s LIMIT 0 , 30", [id_test, bullet])
-        result = cursor.fetchall()
-        cursor.close()
+        with self.connection() as conn:
+            # prepare a cursor object using cursor() method
+            cursor = conn.cursor()
+            cursor.execute("SELECT id, id_scan, tool, exec_time, tool_log.timestamp, output, data FROM  `tool_log` LEFT JOIN `tool_output` ON tool_output.hash = tool_log.output_hash WHERE  `id_scan` = %s AND  `tool_hash` = %s AND  `tool` = %s LIMIT 0 , 30", [id_test, hash_tool(bullet), bullet])
+            result = cursor.fetchall()
+            cursor.close()
+        return [self.tool_log_row(row) for row in result]
+    
+    #the tools that ran in a scan, returns (id, tool) rows
+    def tool_log_list(self, id_scan):
+        with self.connection() as conn:
+            # prepare a cursor object using cursor() method
+            cursor = conn.cursor()
+            cursor.execute("SELECT id, tool FROM `tool_log` WHERE `id_scan` = %s ORDER BY id", [id_scan])
+            result = cursor.fetchall()
+            cursor.close()
         return result
-        
+    
+    #get the (decompressed) output of a tool log
+    def tool_log_output_get(self, id_tool_log):
+        with self.connection() as conn:
+            # prepare a cursor object using cursor() method
+            cursor = conn.cursor()
+            cursor.execute("SELECT output, data FROM  `tool_log` LEFT JOIN `tool_output` ON tool_output.hash = tool_log.output_hash WHERE  tool_log.id = %s", [id_tool_log])
+            result = cursor.fetchone()
+            cursor.close()
+        if result is None:
+            return None
+        if result[1] is None:
+            return result[0]
+        return decompress_output(result[1])
+    
+    #replace the output of a tool log row with the decompressed output, old rows have it in the row itself
+    def tool_log_row(self, row):
+        if row[-1] is None:
+            return row[:-1]
+        return row[:5] + (decompress_output(row[-1]),)
+    
+    def schema_version_get(self):
+        with self.connection() as conn:
+            # prepare a cursor object using cursor() method
+            cursor = conn.cursor()
+            cursor.execute("CREATE TABLE IF NOT EXISTS `schema_version` (`version` int(11) NOT NULL, `name` varchar(255) NOT NULL, `timestamp` timestamp NOT NULL DEFAULT CURRENT_TIMESTAMP, PRIMARY KEY (`version`)) ENGINE=InnoDB DEFAULT CHARSET=utf8;")
+            cursor.execute("SELECT MAX(version) FROM `schema_version`")
+            result = cursor.fetchone()
+            cursor.close()
+        if result[0] is None:
+            return 0
+        return int(result[0])
+    
+    def schema_version_set(self, version, name):
+        with self.connection() as conn:
+            # prepare a cursor object using cursor() method
+            cursor = conn.cursor()
+            cursor.execute("INSERT INTO `schema_version` (`version`, `name`) VALUES (%s, %s);", (version, name))
+            cursor.close()
+            #commit insert
+            conn.commit()
+        return version
+    
+    def execute_statements(self, statements):
+        with self.connection() as conn:
+            # prepare a cursor object using cursor() method
+            cursor = conn.cursor()
+            for statement in statements:
+                cursor.execute(statement)
+            cursor.close()
+            #commit insert
+            conn.commit()
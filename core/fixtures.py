@@ -0,0 +1,135 @@
+#-------------------------------------------------------------------------------
+# Name:        RPTR fixtures
+# Purpose:     Keep recorded tool output around
+#
+# Author:      John de Kroon
+#
+# Created:     18-10-2026
+# Copyright:   (c) John de Kroon 2016
+# Version:     1.0
+#-------------------------------------------------------------------------------
+
+import os
+import re
+import shlex
+import shutil
+import threading
+import conf
+from armory import get_armory
+from rifle import get_tool_name
+from dbmanager import *
+
+#the fixtures dir holds the output of bullets:
+# [bullet]/[index].out  the output of one bullet, for example http/1.out for the second bullet of http.xml
+# [tool].out            the output of every bullet of a tool, for example nikto.out
+#the portscan benchmark and the replay mode read nmap.xml, the xml output (-oX) of nmap
+def get_fixture(bullet_file, index, command, fixtures_dir = None):
+    if fixtures_dir == None:
+        fixtures_dir = conf.get_config('fixtures_dir')
+    paths = []
+    if bullet_file:
+        paths.append(fixtures_dir + os.path.splitext(bullet_file)[0] + "/" + str(index) + ".out")
+    tool = get_tool_name(command)
+    if tool is not None:
+        paths.append(fixtures_dir + tool + ".out")
+    for path in paths:
+        if os.path.isfile(path):
+            return path
+    return None
+
+#a pattern that matches the commands the bullet becomes after its placeholders are filled in
+def get_command_pattern(execute):
+    parts = re.split(r"(\[target\]|\[path\]|\[save_path\]|\[plugins\]|\[port\])", execute)
+    pattern = ""
+    for x in range(0, len(parts)):
+        if x % 2 == 1:
+            pattern += "(.*?)"
+        else:
+            pattern += re.escape(parts[x])
+    return re.compile("^" + pattern + "$", re.S)
+
+#(bullet file, index, pattern) of every bullet, built again when a bullet file changes
+patterns = None
+#(name, mtime) of the bullet files the patterns were built from
+patterns_key = None
+patterns_lock = threading.Lock()
+
+def get_patterns():
+    global patterns
+    global patterns_key
+    armory = get_armory()
+    magazines = []
+    for name in sorted(os.listdir(armory.bullets_dir)):
+        if name.endswith(".xml"):
+            #the armory reads a bullet file again when its mtime changed
+            magazine = armory.get(name)
+            if magazine is not None:
+                magazines.append(magazine)
+    key = tuple((magazine.name, magazine.mtime) for magazine in magazines)
+    with patterns_lock:
+        if patterns is None or patterns_key != key:
+            patterns = []
+            for magazine in magazines:
+                for x in range(0, len(magazine.bullets)):
+                    patterns.append((magazine.name, x, get_command_pattern(magazine.bullets[x].execute)))
+            patterns_key = key
+        return patterns
+
+#find the bullet a command was made of, returns (bullet file, index) or None
+def find_bullet(command):
+    for name, x, pattern in get_patterns():
+        if pattern.match(command):
+            return name, x
+    return None
+
+#find the fixture of a command, returns the path or None
+def find_fixture(command, fixtures_dir = None):
+    bullet = find_bullet(command)
+    if bullet is None:
+        #not a bullet (the portscan, or a bullet that changed), try the tool
+        return get_fixture("", None, command, fixtures_dir)
+    return get_fixture(bullet[0], bullet[1], command, fixtures_dir)
+
+#save the output of the tools of a scan as fixtures, returns the paths that were written
+def record(id_scan, fixtures_dir = None):
+    if fixtures_dir == None:
+        fixtures_dir = conf.get_config('fixtures_dir')
+    dbmanager = Dbmanager()
+    paths = []
+    for id_tool_log, tool in dbmanager.tool_log_list(id_scan):
+        #the output of the portscan is not replayed, its xml is saved while scanning (see record_nmap)
+        if get_tool_name(tool) == "nmap" and " -oX " in tool:
+            continue
+        bullet = find_bullet(tool)
+        if bullet is not None:
+            path = fixtures_dir + os.path.splitext(bullet[0])[0] + "/" + str(bullet[1]) + ".out"
+        else:
+            #the portscan, or a bullet that changed since the scan
+            tool_name = get_tool_name(tool)
+            if tool_name is None:
+                continue
+            path = fixtures_dir + tool_name + ".out"
+        if not os.path.exists(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        with open(path, "wb") as f:
+            f.write(dbmanager.tool_log_output_get(id_tool_log) or "")
+        paths.append(path)
+    return paths
+
+#save the xml file (-oX) of a service detection as nmap.xml, returns the path or None
+#the file is gone after the scan, so this is called right after nmap ran (rptr.py --record-portscan)
+def record_nmap(command, fixtures_dir = None):
+    if fixtures_dir == None:
+        fixtures_dir = conf.get_config('fixtures_dir')
+    args = shlex.split(command)
+    #the sweep of a staged portscan has no service details
+    if "-oX" not in args or "-sV" not in args:
+        return None
+    file_name = args[args.index("-oX") + 1]
+    if not os.path.isfile(file_name):
+        return None
+    if not os.path.exists(fixtures_dir):
+        os.makedirs(fixtures_dir)
+    path = fixtures_dir + "nmap.xml"
+    shutil.copyfile(file_name, path)
+    return path
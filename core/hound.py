@@ -11,6 +11,8 @@
 
 from dbmanager import *
 
+#Rifle returns the output of a tool itself, the hound is only needed
+#to get the output of tools that ran before (for example in an old scan)
 class Hound():
     def __init__(self, id_test):
         self.id_test = id_test
@@ -1,6 +1,6 @@
 #-------------------------------------------------------------------------------
 # Name:        RPTR mass
-# Purpose:     Manage recurent scans (currently not in use)
+# Purpose:     Manage recurent scans
 #
 # Author:      John de Kroon
 #
@@ -10,8 +10,16 @@
 #-------------------------------------------------------------------------------
 
 import os
+import sys
+import time
+import zlib
+import Queue
+import datetime
+import threading
 import conf
 from dbmanager import *
+from scan import *
+from report import write_json
 
 class Mass():
     def __init__(self, type = None):
@@ -40,6 +48,154 @@ class Mass():
             targets[record[0]].append({'id': record[1], 'proof': record[3], 'tool': record[4]})
         return targets
     
+    #print the findings per target while they are read from the database
+    #the rows are ordered by target, so only the findings of one target are kept in memory
+    def print_mass_report(self, id, limit = None, offset = None, target = None):
+        current = None
+        vulns = []
+        for record in self.dbmanager.report_rows_get(None, id, target, limit, offset):
+            if record[0] != current:
+                self.print_target(current, vulns)
+                current = record[0]
+                vulns = []
+            vulns.append({'id': record[1], 'proof': record[3], 'tool': record[4]})
+        self.print_target(current, vulns)
+
+    def print_target(self, target, vulns):
+        if target is None:
+            return
+        print "Vulnerabilities for "+target+" ("+str(len(vulns))+")"
+        print
+        for vuln in vulns:
+            print str(vuln['id'])+": "+str(vuln['tool'])
+        print
+
+    #write the findings as JSON while they are read from the database
+    def write_mass_report(self, id, out = sys.stdout, ndjson = False, limit = None, offset = None, target = None):
+        return write_json(self.dbmanager.report_rows_get(None, id, target, limit, offset), out, ndjson)
+
     def get_bullet_file(self):
         return conf.get_config('mass_bullet_'+self.type)
-        
\ No newline at end of file
+
+#mass types and the column of the targets table with their bullet
+mass_types = (("day", 2), ("week", 3), ("month", 4))
+
+#start (UTC) of the day, week or month that now is in
+def get_period_start(type, now):
+    day = datetime.datetime(now.year, now.month, now.day)
+    if type == "day":
+        return day
+    if type == "week":
+        return day - datetime.timedelta(days=now.weekday())
+    return datetime.datetime(now.year, now.month, 1)
+
+class Daemon():
+    'scans the targets in the targets table when they are due'
+
+    def __init__(self, parallel = None):
+        if parallel == None:
+            parallel = conf.get_config('mass_parallel')
+        self.parallel = parallel
+        self.dbmanager = Dbmanager()
+        self.queue = Queue.Queue()
+        #number of jobs handed to the workers that are not finished
+        self.busy = 0
+        self.lock = threading.Lock()
+        #id_mass -> last time the jobs of that period were planned
+        self.planned = {}
+        #(id, state, id_scan, finished) of jobs that could not be finished, tried again every poll
+        self.unfinished = []
+
+    def run(self):
+        count = self.dbmanager.mass_jobs_reset()
+        if count > 0:
+            print "Resuming "+str(count)+" interrupted scans"
+        for x in range(0, self.parallel):
+            t = threading.Thread(target=self.worker)
+            t.daemon = True
+            t.start()
+        while True:
+            now = datetime.datetime.utcnow()
+            self.finish_unfinished()
+            self.plan(now)
+            self.dispatch(now)
+            time.sleep(conf.get_config('mass_poll'))
+
+    #create a job for every target in the current day, week and month
+    def plan(self, now):
+        targets = None
+        for type, column in mass_types:
+            period_start = get_period_start(type, now)
+            id_mass = self.dbmanager.mass_period_get(type, period_start)
+            #plan again now and then, to pick up new targets
+            last = self.planned.get(id_mass)
+            if last is not None and (now - last).total_seconds() < conf.get_config('mass_plan_interval'):
+                continue
+            if targets is None:
+                targets = self.dbmanager.mass_get_targets()
+            rows = []
+            for target in targets:
+                bullet = target[column]
+                if not bullet:
+                    bullet = conf.get_config('mass_bullet_'+type)
+                #no bullet, the target is not scanned in this period
+                if not bullet:
+                    continue
+                rows.append((id_mass, target[0], bullet, period_start + self.get_offset(target[0], type)))
+            count = self.dbmanager.mass_jobs_plan(rows)
+            if count > 0:
+                print "Planned "+str(count)+" "+type+" scans (mass #"+str(id_mass)+")"
+            self.planned[id_mass] = now
+
+    #spread the scans over the window, every target always gets the same time
+    def get_offset(self, id_target, type):
+        window = conf.get_config('mass_window')[type]
+        return datetime.timedelta(seconds=(zlib.crc32(type+str(id_target)) & 0xffffffff) % window)
+
+    #hand due jobs to the workers, never more than there are free workers
+    def dispatch(self, now):
+        with self.lock:
+            free = self.parallel - self.busy
+        if free <= 0:
+            return
+        for job in self.dbmanager.mass_jobs_due(now, free):
+            if self.dbmanager.mass_job_start(job[0], now):
+                with self.lock:
+                    self.busy += 1
+                self.queue.put(job)
+
+    def worker(self):
+        while True:
+            id, target, bullet, id_mass = self.queue.get()
+            state = "done"
+            id_scan = None
+            try:
+                #the Default profile is the normal procedure: a portscan and the clips of the services
+                bullet_file = bullet
+                if bullet == "Default":
+                    bullet_file = None
+                id_scan = scan_target(target, bullet_file, id_mass)
+            except Exception as e:
+                state = "failed"
+                print " ! Error: mass scan on "+target+" failed: "+str(e)
+            finally:
+                #the worker is free again, even if the job can't be finished now
+                with self.lock:
+                    self.busy -= 1
+                self.finish((id, state, id_scan, datetime.datetime.utcnow()))
+
+    #mark a job as done or failed, if the database is gone the next poll tries again
+    def finish(self, job):
+        try:
+            self.dbmanager.mass_job_finish(*job)
+        except Exception as e:
+            print " ! Error: could not finish mass job #"+str(job[0])+": "+str(e)
+            with self.lock:
+                self.unfinished.append(job)
+
+    def finish_unfinished(self):
+        with self.lock:
+            jobs = self.unfinished
+            self.unfinished = []
+        for job in jobs:
+            self.finish(job)
@@ -0,0 +1,57 @@
+#-------------------------------------------------------------------------------
+# Name:        RPTR migrate
+# Purpose:     Keep the database schema up to date
+#
+# Author:      John de Kroon
+#
+# Created:     18-10-2026
+# Copyright:   (c) John de Kroon 2016
+# Version:     1.0
+#-------------------------------------------------------------------------------
+
+import os
+import re
+import conf
+from dbmanager import *
+
+class Migrate():
+    'runs the migrations in the migrations dir that are not applied yet'
+
+    def __init__(self):
+        self.dbmanager = Dbmanager()
+        self.migrations_dir = conf.get_config('migrations_dir')
+
+    #migrations are named [version]_[name].sql, for example 001_indexes.sql
+    def get_migrations(self):
+        migrations = []
+        for file_name in os.listdir(self.migrations_dir):
+            match = re.match(r"^(\d+)_.*\.sql$", file_name)
+            if match:
+                migrations.append((int(match.group(1)), file_name))
+        migrations.sort()
+        return migrations
+
+    def get_statements(self, file_name):
+        with open(self.migrations_dir + file_name) as f:
+            sql = f.read()
+        #remove comments and split on the ; at the end of a line
+        lines = [line for line in sql.splitlines() if not line.strip().startswith("--")]
+        statements = re.split(r";\s*$", "\n".join(lines), flags=re.M)
+        return [statement.strip() for statement in statements if statement.strip() != ""]
+
+    def get_version(self):
+        return self.dbmanager.schema_version_get()
+
+    def run(self):
+        version = self.get_version()
+        print "Database schema version: "+str(version)
+        for migration in self.get_migrations():
+            if migration[0] <= version:
+                continue
+            print "Applying migration "+migration[1]+"..."
+            #MySQL commits every schema change, so the version is saved after each migration
+            self.dbmanager.execute_statements(self.get_statements(migration[1]))
+            self.dbmanager.schema_version_set(migration[0], migration[1])
+            version = migration[0]
+        print "Database schema is up to date (version "+str(version)+")"
+        return version
@@ -12,104 +12,449 @@
 import os
 import subprocess
 import time
+import re
 import urllib2
-import difflib
 import ssl
+import threading
+import Queue
+import pipes
 
 from lxml import etree
 from dbmanager import *
+from capture import *
+from rifle import get_max_output, run_tool
+from fixtures import record_nmap
+import conf
+
+class Port(object):
+    'an open port of a host in the nmap output'
+    __slots__ = ('host', 'port', 'service', 'product', 'version', 'tunnel', 'duplicate')
+
+    def __init__(self, host, port, service = None, product = None, version = None, tunnel = None):
+        self.host = host
+        self.port = port
+        self.service = service
+        self.product = product
+        self.version = version
+        self.tunnel = tunnel
+        #the port serves the same site as another port
+        self.duplicate = False
+
+    def __repr__(self):
+        return "<Port "+str(self.host)+":"+self.port+" "+str(self.service)+">"
+
+#read the open ports from nmap xml output, one host at a time
+#every host is removed from the tree when it is read, so big scans don't fill the memory
+def iter_ports(file_name):
+    for event, host in etree.iterparse(file_name, events=('end',), tag='host'):
+        address = None
+        for element in host.iterchildren('address'):
+            #prefer the ip address over the mac address
+            if element.get('addrtype') != 'mac':
+                address = element.get('addr')
+                break
+        #keep the name the host was given with, the web servers need it
+        for element in host.iterfind('hostnames/hostname'):
+            if element.get('type') == 'user':
+                address = element.get('name')
+                break
+        ports = host.find('ports')
+        if ports is not None:
+            for port in ports.iterchildren('port'):
+                state = port.find('state')
+                if state is None or state.get('state') != 'open':
+                    continue
+                service = port.find('service')
+                if service is None:
+                    yield Port(address, port.get('portid'))
+                else:
+                    yield Port(address, port.get('portid'), service.get('name'), service.get('product'), service.get('version'), service.get('tunnel'))
+        host.clear()
+        #the hosts that are read are still linked from the root
+        while host.getprevious() is not None:
+            del host.getparent()[0]
+
+#nmap prints this line for every open port it finds when it runs with -v
+discovered = re.compile(r"^Discovered open port (\d+)/tcp on ", re.M)
+
+class SweepCapture(Capture):
+    'catches the output of a port sweep and hands over the open ports as they are found'
+
+    def __init__(self, max_memory, max_size, found):
+        Capture.__init__(self, max_memory, max_size)
+        self.found = found
+        self.line = ""
+
+    def write(self, chunk):
+        Capture.write(self, chunk)
+        #the last line can be cut in half, keep it for the next chunk
+        lines = (self.line + chunk).rsplit("\n", 1)
+        self.line = lines[-1]
+        if len(lines) == 2:
+            for port in discovered.findall(lines[0]):
+                self.found(port)
 
 class Portscan():
-    def __init__(self, id_test, target, save_path):
+    def __init__(self, id_test, target, save_path, on_ports = None, profile = None):
         self.ports = []
         self.id_test = id_test
         self.target = target
         self.save_path = save_path
+        #on_ports is called with every batch of ports that are found, so their clips can start
+        self.on_ports = on_ports
+        if profile == None:
+            profile = conf.get_config('portscan_profile')
+        self.profile = conf.get_config('portscan_profiles')[profile]
         self.output = None
         #fire bullet
         self.dbmanager = Dbmanager()
         #management interfaces
         self.manif = ['ssh', 'telnet', 'vnc', 'ftp', 'mysql', 'microsoft-ds', 'msrpc']
         self.manif_found = False
+        #web ports wait for the duplicate check
+        self.web_ports = []
 
     def parse(self, file_name):
-        port80 = False
-        
-        doc = etree.parse(file_name)
-        for x in doc.xpath("//host[ports/port[state[@state='open']]]"):
-            for open_p in x.xpath("ports/port[state[@state='open']]"):
-                item = open_p.attrib.values()
-                port = item[1]
-                for child in list(open_p):
-                    service = None
-                    product = None
-                    version = None
-                    tunnel = None
-                    for x in child.attrib.iteritems():
-                        if(x[0] == 'name'):
-                            service = x[1]
-                        if(x[0] == 'product'):
-                            product = x[1]
-                        if(x[0] == 'version'):
-                            version = x[1]
-                        if(x[0] == 'tunnel'):
-                            tunnel = x[1]
-                #following test is added to prevent double scanning
-                if port == "80":
-                    port80 = True
-                if port == "443" and port80:
-                    if self.check_diff_80_443(self.target):
-                        print "80 and 443 are same site"
-                        self.ports.append({"port": port, "service": service, "product": product, "version": version, "tunnel": tunnel, "duplicate": True})
-                        continue
-                #check if management interface is detected
-                if service in self.manif:
-                    self.manif_found = True
-                self.ports.append({"port": port, "service": service, "product": product, "version": version, "tunnel": tunnel, "duplicate": False})   
+        #nmap doesn't write the file when it is killed early
+        if not os.path.exists(file_name):
+            return []
+        return list(iter_ports(file_name))
+
+    #run nmap and save its output, returns the id of the tool log and the output
+    def run_nmap(self, command, capture):
+        result = fire_nmap(command, capture)
+        return self.save_log(result), result['output']
+
+    #write tool output to database
+    def save_log(self, result):
+        #the output of a RangePortscan is stored once, the hosts refer to it
+        if 'output_hash' in result:
+            return self.dbmanager.tool_log_shared_create(self.id_test, result['command'], result['exec_time'], result['output_hash'], result['output_size'], result['status'], result['returncode'])
+        return self.dbmanager.tool_log_create(self.id_test, result['command'], result['exec_time'], result['output'], result['status'], result['returncode'])
+
+    def get_capture(self):
+        return get_capture()
 
+    #use the ports a RangePortscan found for this host, results are the nmap runs of the range
+    def load(self, results, ports):
+        id_tool_log = None
+        for result in results:
+            id_tool_log = self.save_log(result)
+        #the proof is the part of the output about this host, not the whole range
+        if len(results) > 0 and len(ports) > 0:
+            self.output = get_host_output(results[-1]['output'], ports)
+        self.add_ports(ports, id_tool_log, self.output)
+        self.add_web_ports()
+
+    #scan the ports of the profile, staged profiles first look for open ports without -sV
     def fire_scan(self):
-        #get current time
-        start = time.time()
-        #start tool execution in new proces
-        command = "nmap --open --top-ports=50 -sV -oX "+self.save_path+"/nmap_scan.xml "+self.target
-        p = subprocess.Popen(command, stdout=subprocess.PIPE, shell=True)
-        #get output form process
-        out, err = p.communicate()
-        self.output = out
-        #calculate how much time the tool used
-        exec_time = time.strftime("%H:%M:%S", time.gmtime(time.time() - start))
-        #write tool output to database
-        id_tool_log = self.dbmanager.tool_log_create(self.id_test, command, exec_time, out)
-        #parse result
-        self.parse(self.save_path+"/nmap_scan.xml")
-        #if management ports are open, create a vulnerability for it 
-        if self.manif_found:
-            self.dbmanager.vulnerability_create(self.id_test, id_tool_log, 1, out)
-        
-    def get_ports(self):
-        return self.ports
-        
-    #check if port 80 and 443 are the same
-    #used to prevent double scanning a website
-    def check_diff_80_443(self, url):
+        if self.profile['staged']:
+            self.fire_staged()
+        else:
+            command = "nmap --open "+self.profile['ports']+" "+self.profile['timing']+" -sV -oX "+self.save_path+"/nmap_scan.xml "+self.target
+            id_tool_log, out = self.run_nmap(command, self.get_capture())
+            self.output = out
+            self.add_ports(self.parse(self.save_path+"/nmap_scan.xml"), id_tool_log, out)
+        self.add_web_ports()
+
+    #sweep the ports and run -sV on the open ports while the sweep is still running
+    def fire_staged(self):
+        found = Queue.Queue()
+        t = threading.Thread(target=self.detect, args=(found,))
+        t.daemon = True
+        t.start()
+        #a syn scan needs root, otherwise use a connect scan
+        scan_type = "-sT"
+        if os.geteuid() == 0:
+            scan_type = "-sS"
+        command = "nmap -v --open "+scan_type+" "+self.profile['ports']+" "+self.profile['timing']+" -oX "+self.save_path+"/nmap_sweep.xml "+self.target
+        capture = SweepCapture(conf.get_config('output_memory_limit'), get_max_output('nmap'), found.put)
         try:
-            url = url.replace("'", "")
-            f = urllib2.urlopen("http://"+url)
-            html80 = f.read(25000).replace("http://", "https://")
-        
+            id_tool_log, self.output = self.run_nmap(command, capture)
+        finally:
+            #stop sign for the detect thread
+            found.put(None)
+            while t.is_alive():
+                t.join(1)
+
+    #run -sV on the open ports, ports found while -sV runs go in the next batch
+    def detect(self, found):
+        done = set()
+        pending = []
+        batch = 0
+        stop = False
+        while not stop or len(pending) > 0:
+            ports = []
+            if len(pending) == 0:
+                #wait for the sweep to find a port
+                ports.append(found.get())
+            #take the ports that were found while the last batch ran
+            while True:
+                try:
+                    ports.append(found.get_nowait())
+                except Queue.Empty:
+                    break
+            for port in ports:
+                if port is None:
+                    stop = True
+                elif port not in done:
+                    done.add(port)
+                    pending.append(port)
+            ports = pending[:self.profile['batch']]
+            pending = pending[self.profile['batch']:]
+            if len(ports) == 0:
+                continue
+            batch += 1
+            file_name = self.save_path+"/nmap_detect_"+str(batch)+".xml"
+            command = "nmap -Pn --open -p "+",".join(ports)+" "+self.profile['timing']+" -sV -oX "+file_name+" "+self.target
             try:
-                ctx = ssl.create_default_context()
-                ctx.check_hostname = False
-                ctx.verify_mode = ssl.CERT_NONE
-                f = urllib2.urlopen("https://"+url, context=ctx)
-            except:
-                f = urllib2.urlopen("https://"+url)
+                id_tool_log, out = self.run_nmap(command, self.get_capture())
+                self.add_ports(self.parse(file_name), id_tool_log, out)
+            except Exception as e:
+                print " ! Error: service detection of ports "+",".join(ports)+" failed: "+str(e)
+
+    #keep the ports and start the clips of the ports that are not web ports
+    def add_ports(self, ports, id_tool_log, out):
+        manif_found = False
+        for port in ports:
+            #check if management interface is detected
+            if port.service in self.manif:
+                manif_found = True
+        #if management ports are open, create a vulnerability for it
+        if manif_found and not self.manif_found:
+            self.manif_found = True
+            if conf.get_config('db_write_behind'):
+                #written together with the other findings of the scan
+                get_writer().add(self.id_test, id_tool_log, 1, out)
+            else:
+                self.dbmanager.vulnerability_create(self.id_test, id_tool_log, 1, out)
+        self.ports.extend(ports)
+        others = []
+        for port in ports:
+            if is_http(port):
+                self.web_ports.append(port)
+            else:
+                others.append(port)
+        if self.on_ports is not None and len(others) > 0:
+            self.on_ports(others)
+
+    #the web ports start when all ports are known, after the duplicate check
+    def add_web_ports(self):
+        #prevent double scanning of a site on http and https
+        self.check_duplicates()
+        if self.on_ports is not None and len(self.web_ports) > 0:
+            self.on_ports(self.web_ports)
+
+    def get_ports(self):
+        return self.ports
         
-            html443 = f.read(25000)
-	    
-            s = difflib.SequenceMatcher(lambda x: x == " ", html443, html80)
-            if round(s.ratio(), 3) > 0.75:
-                return True
-            return False
-        except:
-            return False
\ No newline at end of file
+    #mark https ports that serve the same site as a http port as duplicate
+    #the pages of all web ports are fetched at the same time, after the portscan
+    def check_duplicates(self):
+        #the replayed hosts are not real, don't visit them
+        if conf.get_config('replay'):
+            return
+        http = [port for port in self.ports if is_http(port) and not is_https(port)]
+        https = [port for port in self.ports if is_http(port) and is_https(port)]
+        if len(http) == 0 or len(https) == 0:
+            return
+        pages = probe_pages(self.target, http + https, conf.get_config('http_probe_timeout'))
+        threshold = conf.get_config('http_similarity')
+        for port in https:
+            if pages[port.port] is None:
+                continue
+            page, server = pages[port.port]
+            for other in http:
+                if pages[other.port] is None:
+                    continue
+                other_page, other_server = pages[other.port]
+                #another web server is another site, the pages don't need to be compared
+                if differ(port.product, other.product) or differ(server, other_server):
+                    continue
+                if similarity(page, other_page.replace("http://", "https://"), threshold) > threshold:
+                    print other.port+" and "+port.port+" are same site"
+                    port.duplicate = True
+                    break
+
+class RangePortscan():
+    'one portscan of many hosts and ranges, the ports are handed out per host'
+
+    def __init__(self, targets, save_path, profile = None):
+        self.targets = targets
+        self.save_path = save_path
+        if profile == None:
+            profile = conf.get_config('portscan_profile')
+        self.profile = conf.get_config('portscan_profiles')[profile]
+        self.dbmanager = Dbmanager()
+        #the nmap runs, their output is stored once and every host refers to it in its tool log
+        self.results = []
+        self.hosts = []
+
+    #nmap scans many hosts in one run much faster than every host on its own
+    def fire_scan(self):
+        targets = " ".join(self.targets)
+        if self.profile['staged']:
+            #sweep all hosts, then run -sV on the hosts with open ports
+            scan_type = "-sT"
+            if os.geteuid() == 0:
+                scan_type = "-sS"
+            file_name = self.save_path+"/nmap_sweep.xml"
+            command = "nmap --open "+scan_type+" "+self.profile['ports']+" "+self.profile['timing']+" -oX "+file_name+" "+targets
+            self.results.append(self.store(fire_nmap(command, get_capture())))
+            hosts = []
+            ports = set()
+            for port in self.parse(file_name):
+                if port.host not in hosts:
+                    hosts.append(port.host)
+                ports.add(port.port)
+            if len(hosts) == 0:
+                return self.hosts
+            port_list = ",".join(sorted(ports, key=int))
+            #the names come from the nmap output, quote them for the shell
+            targets = " ".join(pipes.quote(host) for host in hosts)
+            command = "nmap -Pn --open -p "+port_list+" "+self.profile['timing']+" -sV -oX "+self.save_path+"/nmap_scan.xml "+targets
+        else:
+            command = "nmap --open "+self.profile['ports']+" "+self.profile['timing']+" -sV -oX "+self.save_path+"/nmap_scan.xml "+targets
+        self.results.append(self.store(fire_nmap(command, get_capture())))
+        #group the ports by host, in the order nmap found them
+        hosts = {}
+        for port in self.parse(self.save_path+"/nmap_scan.xml"):
+            if port.host not in hosts:
+                hosts[port.host] = []
+                self.hosts.append((port.host, hosts[port.host]))
+            hosts[port.host].append(port)
+        return self.hosts
+
+    def parse(self, file_name):
+        #nmap doesn't write the file when it is killed early
+        if not os.path.exists(file_name):
+            return []
+        return iter_ports(file_name)
+
+    #save the output of a run in the database, the hosts only add a tool log that refers to it
+    def store(self, result):
+        result['output_hash'], result['output_size'] = self.dbmanager.tool_output_create(result['output'])
+        return result
+
+    #list of (host, ports) of the hosts with open ports
+    def get_hosts(self):
+        return self.hosts
+
+    def get_results(self):
+        return self.results
+
+#run nmap, returns the output and how it ran
+def fire_nmap(command, capture):
+    #get current time
+    start = time.time()
+    #start tool execution in new proces
+    returncode, timed_out = run_tool(command, capture, conf.get_config('portscan_timeout'))
+    out = capture.read()
+    capture.close()
+    status = "done"
+    if timed_out:
+        status = "timeout"
+    #calculate how much time the tool used
+    exec_time = time.strftime("%H:%M:%S", time.gmtime(time.time() - start))
+    if conf.get_config('record_portscan') and not conf.get_config('replay'):
+        record_nmap(command)
+    return {'command': command, 'exec_time': exec_time, 'output': out, 'status': status, 'returncode': returncode}
+
+#the part of the nmap output about the host of the ports
+def get_host_output(output, ports):
+    host = re.escape(ports[0].host)
+    starts = [match.start() for match in re.finditer(r"^Nmap scan report for ", output, re.M)]
+    for x in range(0, len(starts)):
+        end = len(output)
+        if x + 1 < len(starts):
+            end = starts[x + 1]
+        part = output[starts[x]:end]
+        #"for 10.0.0.1", "for example.com (10.0.0.1)" or "for name (10.0.0.1)"
+        if re.match(r"Nmap scan report for (?:\S+ \()?"+host+r"[\s\)]", part):
+            #the lines after the last host are about the whole run
+            return re.split(r"^(?:Service detection performed|Nmap done)", part, flags=re.M)[0]
+    #not in the output (it was cut off), list the ports instead
+    lines = []
+    for port in ports:
+        lines.append(port.port+"/tcp open "+" ".join(x for x in (port.service, port.product, port.version) if x))
+    return "\n".join(lines)+"\n"
+
+def get_capture():
+    #the details are in the xml file so the output is small
+    return Capture(conf.get_config('output_memory_limit'), get_max_output('nmap'))
+
+#bytes of a page that are compared
+PAGE_SIZE = 25000
+#number of words in a shingle
+SHINGLE_SIZE = 3
+
+def is_http(port):
+    return port.service is not None and port.service.startswith("http")
+
+def is_https(port):
+    return port.tunnel == "ssl" or port.service == "https"
+
+#fetch the first page of every port at the same time, returns a dict of port: (page, server header)
+#the value is None when the port didn't answer in time
+def probe_pages(target, ports, timeout):
+    host = target.replace("'", "")
+    pages = {}
+    threads = []
+    for port in ports:
+        pages[port.port] = None
+        t = threading.Thread(target=probe_page, args=(pages, host, port, timeout))
+        t.daemon = True
+        t.start()
+        threads.append(t)
+    #the socket timeout covers connecting and every read, the deadline covers pages that trickle in
+    #all threads share it, so the probes never take longer than the slowest one
+    deadline = time.time() + timeout * 2
+    for t in threads:
+        t.join(max(0, deadline - time.time()))
+    #threads that are still running can't change the result anymore
+    return dict(pages)
+
+def probe_page(pages, host, port, timeout):
+    if is_https(port):
+        url = "https://"+host
+        default = "443"
+    else:
+        url = "http://"+host
+        default = "80"
+    if port.port != default:
+        url += ":"+port.port
+    try:
+        if is_https(port):
+            ctx = ssl.create_default_context()
+            ctx.check_hostname = False
+            ctx.verify_mode = ssl.CERT_NONE
+            f = urllib2.urlopen(url, timeout=timeout, context=ctx)
+        else:
+            f = urllib2.urlopen(url, timeout=timeout)
+        pages[port.port] = (f.read(PAGE_SIZE), f.info().getheader('Server'))
+        f.close()
+    except Exception:
+        pass
+
+#both values are known and they are not the same
+def differ(a, b):
+    return a is not None and b is not None and a != b
+
+def get_shingles(page):
+    words = re.findall(r"\S+", page)
+    if len(words) < SHINGLE_SIZE:
+        return set([" ".join(words)])
+    return set(" ".join(words[x:x + SHINGLE_SIZE]) for x in range(0, len(words) - SHINGLE_SIZE + 1))
+
+#similarity of two pages between 0 and 1, like difflib's ratio() but in linear time
+#the pages are compared as sets of word shingles (2 * common / total)
+#returns 0 when the number of shingles shows the pages can't be more alike than threshold
+def similarity(a, b, threshold = 0):
+    if len(a) == 0 and len(b) == 0:
+        return 1.0
+    shingles_a = get_shingles(a)
+    shingles_b = get_shingles(b)
+    #the common shingles are at most the shingles of the smallest page
+    if 2.0 * min(len(shingles_a), len(shingles_b)) / (len(shingles_a) + len(shingles_b)) <= threshold:
+        return 0.0
+    return 2.0 * len(shingles_a & shingles_b) / (len(shingles_a) + len(shingles_b))
@@ -0,0 +1,170 @@
+#-------------------------------------------------------------------------------
+# Name:        RPTR profiler
+# Purpose:     Find out where the time of a scan goes
+#
+# Author:      John de Kroon
+#
+# Created:     18-10-2026
+# Copyright:   (c) John de Kroon 2016
+# Version:     1.0
+#-------------------------------------------------------------------------------
+
+import os
+import json
+import time
+import ctypes
+import ctypes.util
+import threading
+from collections import deque
+import conf
+
+#time.time() jumps when the clock is set, use the monotonic clock of the system if there is one
+class timespec(ctypes.Structure):
+    _fields_ = [('tv_sec', ctypes.c_long), ('tv_nsec', ctypes.c_long)]
+
+CLOCK_MONOTONIC = 1
+
+try:
+    librt = ctypes.CDLL(ctypes.util.find_library('rt') or ctypes.util.find_library('c'), use_errno=True)
+    clock_gettime = librt.clock_gettime
+    clock_gettime.argtypes = [ctypes.c_int, ctypes.POINTER(timespec)]
+except (OSError, AttributeError):
+    clock_gettime = None
+
+#seconds from an unknown starting point, only use it for durations
+def monotonic():
+    if clock_gettime is None:
+        return time.time()
+    t = timespec()
+    if clock_gettime(CLOCK_MONOTONIC, ctypes.byref(t)) != 0:
+        return time.time()
+    return t.tv_sec + t.tv_nsec * 1e-9
+
+class Span():
+    'one timed phase, use it in a with block. Add details to args before the block ends'
+
+    def __init__(self, profiler, name, category, args):
+        self.profiler = profiler
+        self.name = name
+        self.category = category
+        self.args = args
+        self.start = None
+
+    def __enter__(self):
+        self.start = monotonic()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.profiler.add(self.name, self.category, self.start, monotonic() - self.start, self.args)
+        return False
+
+class NoArgs(dict):
+    'a dict that stays empty, the threads share it'
+
+    def __setitem__(self, key, value):
+        pass
+
+    def update(self, *args, **kwargs):
+        pass
+
+    def setdefault(self, key, default = None):
+        return default
+
+class NoSpan():
+    'does nothing, used when the profiler is off'
+
+    def __init__(self):
+        self.args = NoArgs()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+no_span = NoSpan()
+
+#names in the summary, later names are added up as (other)
+MAX_NAMES = 10000
+
+class Profiler():
+    'records how long the phases of the scans take'
+
+    def __init__(self, enabled = False):
+        self.enabled = enabled
+        #the newest events, for the trace
+        self.events = deque(maxlen=conf.get_config('trace_max_events'))
+        #(category, name) -> totals of every event, for the summary
+        self.summary = {}
+        self.lock = threading.Lock()
+        self.start = monotonic()
+
+    #time a phase: with profiler.span("nikto", "tool") as span: ...
+    def span(self, name, category, **args):
+        if not self.enabled:
+            return no_span
+        return Span(self, name, category, args)
+
+    def add(self, name, category, start, duration, args = None):
+        if not self.enabled:
+            return
+        #complete event ('X') of the chrome trace format, times are in microseconds
+        event = {'name': name, 'cat': category, 'ph': 'X', 'ts': int((start - self.start) * 1000000), 'dur': int(duration * 1000000), 'pid': os.getpid(), 'tid': threading.current_thread().ident}
+        if args:
+            event['args'] = args
+        with self.lock:
+            self.events.append(event)
+            key = (category, name)
+            #the scans of a daemon are named after their target, keep the number of names bounded
+            if key not in self.summary and len(self.summary) >= MAX_NAMES:
+                key = (category, "(other)")
+            if key not in self.summary:
+                self.summary[key] = {'count': 0, 'total': 0, 'max': 0, 'bytes': 0}
+            item = self.summary[key]
+            item['count'] += 1
+            item['total'] += event['dur']
+            item['max'] = max(item['max'], event['dur'])
+            if args:
+                item['bytes'] += args.get('bytes', 0)
+
+    #write the events as a trace, open it in chrome://tracing or https://ui.perfetto.dev
+    def export(self, file_name):
+        with self.lock:
+            events = list(self.events)
+        with open(file_name, "w") as f:
+            json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, f)
+
+    #total time, count and maximum per category and name
+    def get_summary(self):
+        with self.lock:
+            return dict((key, dict(item)) for key, item in self.summary.items())
+
+    def print_summary(self):
+        summary = self.get_summary()
+        totals = {}
+        for key in summary:
+            totals[key[0]] = totals.get(key[0], 0) + summary[key]['total']
+        print "Profile (seconds, phases that run side by side are added up)"
+        for category in sorted(totals, key=totals.get, reverse=True):
+            print
+            print "%-10s %10.3f" % (category, totals[category] / 1000000.0)
+            keys = [key for key in summary if key[0] == category]
+            keys.sort(key=lambda key: summary[key]['total'], reverse=True)
+            #the slowest names of the category, the long tail is not interesting
+            for key in keys[:conf.get_config('profile_top')]:
+                item = summary[key]
+                line = "  %-60s %6d x %10.3f (max %.3f)" % (key[1][:60], item['count'], item['total'] / 1000000.0, item['max'] / 1000000.0)
+                if item['bytes'] > 0:
+                    line += " %d bytes" % item['bytes']
+                print line
+
+#one profiler per process
+profiler = None
+profiler_lock = threading.Lock()
+
+def get_profiler():
+    global profiler
+    with profiler_lock:
+        if profiler is None:
+            profiler = Profiler(conf.get_config('profile') or conf.get_config('trace_file') is not None)
+    return profiler
@@ -0,0 +1,127 @@
+#-------------------------------------------------------------------------------
+# Name:        RPTR replay
+# Purpose:     Pretend to run the tools
+#
+# Author:      John de Kroon
+#
+# Created:     18-10-2026
+# Copyright:   (c) John de Kroon 2016
+# Version:     1.0
+#-------------------------------------------------------------------------------
+
+import re
+import time
+import signal
+import shlex
+import random
+import socket
+import struct
+import conf
+from fixtures import *
+from capture import CHUNK_SIZE
+
+#ports of the replayed hosts when there is no fixtures/nmap.xml
+DEFAULT_PORTS = ('<ports>'
+    '<port protocol="tcp" portid="22"><state state="open" reason="syn-ack"/><service name="ssh" product="OpenSSH" version="7.4" method="probed"/></port>'
+    '<port protocol="tcp" portid="80"><state state="open" reason="syn-ack"/><service name="http" product="Apache httpd" version="2.4.6" method="probed"/></port>'
+    '<port protocol="tcp" portid="443"><state state="open" reason="syn-ack"/><service name="https" product="Apache httpd" tunnel="ssl" method="probed"/></port>'
+    '</ports>')
+
+#seconds a replayed tool takes, random between the minimum and maximum of the tool
+def get_latency(tool):
+    latency = conf.get_config('replay_tool_latency').get(tool, conf.get_config('replay_latency'))
+    return random.uniform(latency[0], latency[1])
+
+#instead of running the command, wait a while and put the recorded output in the capture
+#same return values as run_tool
+def replay_tool(command, capture, timeout = None):
+    tool = get_tool_name(command)
+    latency = get_latency(tool)
+    timed_out = False
+    if timeout and latency > timeout:
+        timed_out = True
+        print " ! Warning: timeout, killing replayed "+str(tool)
+    time.sleep(min(latency, timeout or latency))
+    if tool == "nmap" and " -oX " in command:
+        #a killed nmap doesn't write its xml file
+        output = ""
+        if not timed_out:
+            output = replay_nmap(command)
+    else:
+        output = ""
+        path = find_fixture(command)
+        if path is not None:
+            with open(path, "rb") as f:
+                output = f.read()
+        if timed_out:
+            #the part the tool wrote before it was killed
+            output = output[:int(len(output) * timeout / latency)]
+    #in chunks, like the output of a real tool
+    for x in range(0, len(output), CHUNK_SIZE):
+        capture.write(output[x:x + CHUNK_SIZE])
+    if timed_out:
+        #the shell of the tool is killed by the SIGTERM of kill_tool
+        return -signal.SIGTERM, True
+    return 0, False
+
+#write the xml file of a portscan, every target gets the ports of the recorded scan
+#returns the normal output of nmap
+def replay_nmap(command):
+    args = shlex.split(command)
+    file_name = args[args.index("-oX") + 1]
+    #the targets are at the end of the command
+    targets = args[args.index("-oX") + 2:]
+    ports = get_ports()
+    #-p with a list of ports is the service detection of a staged portscan
+    if "-p" in args and re.match(r"^[\d,]+$", args[args.index("-p") + 1]):
+        ports = filter_ports(ports, args[args.index("-p") + 1].split(","))
+    output = []
+    with open(file_name, "w") as f:
+        f.write('<?xml version="1.0"?>\n<nmaprun scanner="nmap" args="'+command.replace('"', '&quot;')+'">\n')
+        for target in targets:
+            for host in expand_target(target):
+                if re.match(r"^[\d\.]+$", host):
+                    f.write('<host><status state="up"/><address addr="'+host+'" addrtype="ipv4"/><hostnames/>'+ports+'</host>\n')
+                else:
+                    f.write('<host><status state="up"/><address addr="127.0.0.1" addrtype="ipv4"/><hostnames><hostname name="'+host+'" type="user"/></hostnames>'+ports+'</host>\n')
+                for port in re.findall(r'portid="(\d+)"', ports):
+                    output.append("Discovered open port "+port+"/tcp on "+host+"\n")
+        f.write('</nmaprun>\n')
+    return "".join(output)
+
+#the ports of the first host with ports in fixtures/nmap.xml
+def get_ports():
+    try:
+        with open(conf.get_config('fixtures_dir') + "nmap.xml") as f:
+            recorded = f.read()
+    except IOError:
+        return DEFAULT_PORTS
+    match = re.search(r"<ports>.*?</ports>", recorded, re.S)
+    if match is None:
+        return DEFAULT_PORTS
+    return match.group(0)
+
+def filter_ports(ports, keep):
+    return re.sub(r'<port [^>]*portid="(\d+)".*?</port>', lambda match: match.group(0) if match.group(1) in keep else "", ports, flags=re.S)
+
+#the hosts of a target, ranges like 10.0.0.0/24 and 10.0.0.1-20 are expanded
+def expand_target(target):
+    match = re.match(r"^(\d+\.\d+\.\d+\.\d+)/(\d+)$", target)
+    if match:
+        bits = int(match.group(2))
+        #the ranges are replayed host by host, don't go bigger than a /16
+        if bits < 16:
+            bits = 16
+        start = struct.unpack("!I", socket.inet_aton(match.group(1)))[0] & (0xFFFFFFFF << (32 - bits) & 0xFFFFFFFF)
+        return [socket.inet_ntoa(struct.pack("!I", start + x)) for x in range(0, 2 ** (32 - bits))]
+    match = re.match(r"^(\d+\.\d+\.\d+\.)([\d,\-]+)$", target)
+    if match and re.search(r"[,\-]", match.group(2)):
+        hosts = []
+        for part in match.group(2).split(","):
+            if "-" in part:
+                low, high = part.split("-")
+                hosts.extend(match.group(1) + str(x) for x in range(int(low), int(high) + 1))
+            else:
+                hosts.append(match.group(1) + part)
+        return hosts
+    return [target]
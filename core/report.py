@@ -9,17 +9,21 @@
 # Version:     1.0
 #-------------------------------------------------------------------------------
 
-import xml.etree.ElementTree as ET
+import sys
 import conf
 import json
 from dbmanager import *
+from templates import *
+from profiler import *
 
 class Report:
-    def __init__(self, id_test = None):
+    def __init__(self, id_test = None, template = None):
         #do something
         self.dbmanager = Dbmanager()
         self.id_test = id_test
         self.verbose = True
+        #template file (language) of the report, None is the default template
+        self.template = template
         
     def test_list_domain(self, domain):
         list = self.dbmanager.test_list_domain(domain)
@@ -27,9 +31,34 @@ class Report:
     
     def print_results(self, loots):
         results = self.merge_lists(loots)
+        rows = []
         for result in results:
-            self.dbmanager.vulnerability_create(self.id_test, result['id_tool_log'], result['id'], result['match'])
-        self.get_report(self.id_test)
+            rows.append((self.id_test, result['id_tool_log'], result['id'], result['match']))
+        with get_profiler().span("save_results", "report", rows=len(rows)):
+            self.save_results(rows)
+        if conf.get_config('db_write_behind'):
+            #the findings can still be in the buffer of the writer, print them from memory
+            with get_profiler().span("print_findings", "report"):
+                self.print_findings(results)
+        else:
+            with get_profiler().span("get_report", "report"):
+                self.get_report(self.id_test)
+    
+    #write all findings of the scan in one transaction, or hand them to the writer
+    def save_results(self, rows):
+        if conf.get_config('db_write_behind'):
+            #written with the findings of other scans, when the buffer is full or old enough
+            get_writer().add_many(rows)
+        else:
+            self.dbmanager.vulnerability_create_many(rows)
+    
+    #print the findings of the clips without reading them from the database
+    #the management port finding and the findings an incremental scan copied are only in the report of -r
+    def print_findings(self, results):
+        result_list = []
+        for result in results:
+            result_list.append({'id': str(result['id']), 'prove': "tool log #"+str(result['id_tool_log']), 'id_tool_log': result['id_tool_log'], 'match': result['match'], 'description': None})
+        self.prepare_verbose(result_list)
     
     def merge_lists(self, loots):
         results = []
@@ -41,27 +70,27 @@ class Report:
         return results
     
     def prepare_verbose(self, results):
-        templates_dir = conf.get_config('templates_dir')
-        template_name = conf.get_config('default_template')
-        template_xml = ET.parse(templates_dir + template_name).getroot()
         print "RPTR found "+str(len(results))+" findings"
         print
         for result in results:
-            x = str(result['id'])
-            xmlresults = template_xml.findall(".//title/..[id='"+x+"']")
-            if len(xmlresults) is not 0:
-                print " >> "+xmlresults[0].find('title').text
-                print "Description: "+xmlresults[0].find('description').text
-                if result['description'] is not None:
-                    print str(result['description'])
-                print "Recommendation: "+xmlresults[0].find('recommendation').text
-                print
-            else:
-                print " !! Unkown vulnerability found"
-                print "ID: "+str(result['id'])
-                print "Tool: "+result['prove']
-                print "Please consider making a template for this vulnerability. Otherwise I *might* post on your Facebook that you like Justin Bieber"
-                print
+            self.print_finding(result)
+    
+    def print_finding(self, result):
+        #the templates are loaded once and looked up by id
+        template = get_template(result['id'], self.template)
+        if template is not None:
+            print " >> "+template.title
+            print "Description: "+template.description
+            if result['description'] is not None:
+                print str(result['description'])
+            print "Recommendation: "+template.recommendation
+            print
+        else:
+            print " !! Unkown vulnerability found"
+            print "ID: "+str(result['id'])
+            print "Tool: "+result['prove']
+            print "Please consider making a template for this vulnerability. Otherwise I *might* post on your Facebook that you like Justin Bieber"
+            print
     
     def get_report(self, id_test = None):
         result = self.dbmanager.test_get(self.id_test)
@@ -86,6 +115,26 @@ class Report:
             result_list.append({'id': str(row[1]), 'prove': row[4], 'id_tool_log': row[2], 'match': row[3], 'description': None})
         self.prepare_verbose(result_list)
 
+    #print the findings of the scan while they are read from the database, the count comes last
+    #limit, offset and target work like they do for write_report, returns the number of findings
+    def print_report(self, limit = None, offset = None, target = None):
+        count = 0
+        for row in self.dbmanager.report_rows_get(self.id_test, None, target, limit, offset):
+            if count == 0:
+                print "Results for target: "+row[0]
+                print
+            self.print_finding({'id': str(row[1]), 'prove': row[4], 'id_tool_log': row[2], 'match': row[3], 'description': None})
+            count += 1
+        if count == 0:
+            print "Report not found or no findings"
+        else:
+            print "RPTR found "+str(count)+" findings"
+        return count
+
+    #write the findings of the scan as JSON while they are read from the database
+    def write_report(self, out = sys.stdout, ndjson = False, limit = None, offset = None, target = None):
+        return write_json(self.dbmanager.report_rows_get(self.id_test, None, target, limit, offset), out, ndjson)
+
     def addJsonString(self, jsonString):
         global resultList
         try:
@@ -123,4 +172,27 @@ class Report:
         self.verbose = verbose
         
     def get_verbose(self):
-        return self.verbose;
\ No newline at end of file
+        return self.verbose;
+
+#a finding in the JSON output, the same fields as parseResultsJson with the target added
+def row_to_dict(row):
+    return {'target': row[0], 'id': str(row[1]), 'prove': row[4], 'id_tool_log': row[2], 'match': row[3], 'description': None}
+
+#write the findings as one JSON array, or as one JSON object per line (ndjson)
+#every row is written when it is read, returns the number of findings
+def write_json(rows, out, ndjson = False):
+    count = 0
+    if not ndjson:
+        out.write("[")
+    for row in rows:
+        if ndjson:
+            out.write(json.dumps(row_to_dict(row))+"\n")
+        else:
+            if count > 0:
+                out.write(", ")
+            out.write(json.dumps(row_to_dict(row)))
+        count += 1
+    if not ndjson:
+        out.write("]\n")
+    out.flush()
+    return count
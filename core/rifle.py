@@ -10,28 +10,104 @@
 #-------------------------------------------------------------------------------
 
 import os
+import signal
 import subprocess
+import threading
 from dbmanager import *
+from capture import *
+import conf
 import time
 
+#interpreters are skipped when looking for the name of the tool
+interpreters = ('python', 'python2', 'python3', 'perl', 'ruby', 'sh', 'bash')
+
+#get the name of the tool a bullet runs, for example 'nikto' for [plugins]nikto/nikto.pl
+def get_tool_name(command):
+    for part in command.split():
+        name = os.path.basename(part.strip("'\""))
+        if name in interpreters:
+            continue
+        return os.path.splitext(name)[0]
+    return None
+
+#the maximum output size of a tool, None means no limit
+def get_max_output(tool):
+    limits = conf.get_config('tool_output_limits')
+    if tool in limits:
+        return limits[tool]
+    return conf.get_config('max_output_size')
+
+#run a tool and read its output into the capture
+#returns the exit code and whether the tool was killed because it took too long
+def run_tool(command, capture, timeout = None):
+    if conf.get_config('replay'):
+        #imported here, the replay mode needs the armory and is only used for testing
+        from replay import replay_tool
+        return replay_tool(command, capture, timeout)
+    #the tool gets its own process group, so the shell and everything it started can be killed
+    p = subprocess.Popen(command, stdout=subprocess.PIPE, shell=True, preexec_fn=os.setsid)
+    killed = threading.Event()
+    timer = None
+    if timeout:
+        timer = threading.Timer(timeout, kill_tool, [p, killed])
+        timer.daemon = True
+        timer.start()
+    try:
+        #the output is read until every process in the group closed it
+        capture.read_from(p.stdout)
+        p.wait()
+    finally:
+        if timer is not None:
+            timer.cancel()
+    return p.returncode, killed.is_set()
+
+def kill_tool(p, killed):
+    killed.set()
+    print " ! Warning: timeout, killing "+str(p.pid)
+    try:
+        os.killpg(p.pid, signal.SIGTERM)
+        #give the tools some time to write their output, then kill them for real
+        time.sleep(conf.get_config('kill_grace'))
+        os.killpg(p.pid, signal.SIGKILL)
+    except OSError:
+        #all processes are gone already
+        pass
+
 class Rifle:
     'shoots bullets'
     
-    def __init__(self, id_test, command):
+    def __init__(self, id_test, command, timeout = None, cache_key = None, port = None):
         #create new dbmanager
         self.dbmanager = Dbmanager()
+        self.result = None
         #fire bullet
-        self.fire_bullet(id_test, command)
+        self.fire_bullet(id_test, command, timeout, cache_key, port)
     
-    def fire_bullet(self, id_test, command):            
+    def fire_bullet(self, id_test, command, timeout = None, cache_key = None, port = None):            
         os.chdir(os.path.dirname(os.path.abspath(__file__)))
         #get current time
         start = time.time()
+        #read the output while the tool runs, large output goes to a temp file
+        capture = Capture(conf.get_config('output_memory_limit'), get_max_output(get_tool_name(command)))
         #start tool execution in new proces
-        p = subprocess.Popen(command, stdout=subprocess.PIPE, shell=True)
-        #get output form process
-        out, err = p.communicate()
+        returncode, timed_out = run_tool(command, capture, timeout)
+        out = capture.get_output()
         #calculate how much time the tool used
-        exec_time = time.strftime("%H:%M:%S", time.gmtime(time.time() - start))
+        duration = time.time() - start
+        exec_time = time.strftime("%H:%M:%S", time.gmtime(duration))
+        #loots are still matched on the output of tools that timed out, the status tells it is partial
+        status = "done"
+        if timed_out:
+            status = "timeout"
+        elif capture.is_truncated():
+            status = "truncated"
         #write tool output to database
-        self.dbmanager.tool_log_create(id_test, command, exec_time, out)
\ No newline at end of file
+        id_tool_log = self.dbmanager.tool_log_create(id_test, command, exec_time, out, status, returncode, cache_key, port)
+        #keep the result, so it doesn't have to be read back from the database
+        #the output can be a mmap, call close() on the capture when the output is processed
+        self.result = {'id': id_tool_log, 'output': out, 'exec_time': exec_time, 'duration': duration, 'returncode': returncode, 'status': status, 'size': capture.get_size(), 'truncated': capture.is_truncated(), 'capture': capture}
+        return self.result
+    
+    #same format as Hound.loot_get, with the timing and exit code added
+    def get_result(self):
+        return self.result
@@ -0,0 +1,208 @@
+#-------------------------------------------------------------------------------
+# Name:        RPTR scan
+# Purpose:     Everything one scan of one target needs
+#
+# Author:      John de Kroon
+#
+# Created:     18-10-2026
+# Copyright:   (c) John de Kroon 2016
+# Version:     1.0
+#-------------------------------------------------------------------------------
+
+import os
+import re
+import md5
+import time
+import shutil
+import conf
+from report import *
+from portscan import *
+from scheduler import *
+from dbmanager import *
+from profiler import *
+
+class Scan():
+    'the state of a scan, so targets can be scanned at the same time'
+
+    def __init__(self, url, bullet_file = None, id_mass = None, incremental = None, portscan_profile = None, portscan = None):
+        self.url = url
+        self.bullet_file = bullet_file
+        self.id_mass = id_mass
+        #skip services that didn't change since the previous scan
+        if incremental == None:
+            incremental = conf.get_config('incremental')
+        self.incremental = incremental
+        self.portscan_profile = portscan_profile
+        #(results, ports) of a portscan that was shared with other hosts, None runs a portscan
+        self.portscan = portscan
+        self.profile = None
+        self.id_scan = None
+        self.report = None
+        self.save_path = None
+        self.scheduler = None
+        #the ports of the previous scan and the ports of this scan, for incremental scans
+        self.previous = None
+        self.port_rows = []
+        self.dbmanager = Dbmanager()
+
+    def run(self):
+        with get_profiler().span(self.url, "scan"):
+            return self.fire()
+
+    def fire(self):
+        #the hosts of a range get their own scans (see scan_target), one scan would mix them up
+        if is_range(self.url.strip("'")):
+            raise ValueError(self.url+" is a range, its hosts are scanned one by one (see scan_target)")
+        self.profile = self.bullet_file
+        if self.profile == None:
+            self.profile = "Default"
+
+        self.id_scan = self.dbmanager.test_create(self.url, self.id_mass, self.profile)
+        self.report = Report(self.id_scan)
+        self.report.set_verbose(True)
+
+        self.report.printer("Start scan #"+str(self.id_scan)+" on "+self.url+"...")
+        self.report.printer("Created DB entry. Scan ID is "+str(self.id_scan))
+
+        start = time.time()
+        self.save_path = create_dir()
+        print self.save_path
+
+        #all clips of the scan run side by side
+        self.scheduler = Scheduler(self.id_scan, self.url, self.save_path)
+        status = "failed"
+        try:
+            if self.bullet_file == None:
+                self.scheduler.submit("general")
+                #the clips of the ports start as soon as their service is known
+                portscanner = Portscan(self.id_scan, self.url, self.save_path, self.submit_ports, self.portscan_profile)
+                with get_profiler().span(self.url, "portscan"):
+                    if self.portscan is None:
+                        portscanner.fire_scan()
+                    else:
+                        portscanner.load(self.portscan[0], self.portscan[1])
+                print portscanner.get_ports()
+                self.dbmanager.scan_ports_create(self.id_scan, self.port_rows)
+            else:
+                self.scheduler.submit(self.bullet_file)
+            self.scheduler.join()
+            with get_profiler().span(self.url, "report"):
+                self.report.print_results(self.scheduler.get_loots())
+            status = "done"
+        finally:
+            try:
+                #the clips that already run still write in the dir
+                self.scheduler.join()
+            finally:
+                shutil.rmtree(self.save_path, True)
+                exec_time = time.strftime("%H:%M:%S", time.gmtime((time.time() - start)))
+                if status == "done":
+                    self.report.printer("done")
+                else:
+                    self.report.printer(" ! Error: scan #"+str(self.id_scan)+" failed")
+                self.dbmanager.test_update_time(self.id_scan, exec_time, status)
+        return self.id_scan
+
+    def submit_port(self, port):
+        #skip duplicate functions (like 80 and 443)
+        if port.duplicate == False:
+            self.scheduler.submit(port.service, port.port)
+        if port.tunnel == 'ssl' and port.service == "https":
+            self.scheduler.submit(port.tunnel, port.port)
+
+    #submit the clips of the ports. In incremental mode, ports with the same service as
+    #in the previous scan are skipped and their findings are copied from that scan
+    #the portscan calls this for every batch of ports it finds
+    def submit_ports(self, ports):
+        if self.previous is None:
+            self.previous = self.get_previous_ports()
+        id_previous, previous = self.previous
+        for port in ports:
+            fingerprint = (port.port, port.service, port.product, port.version, port.tunnel, port.duplicate)
+            #time the clips of the port ran, None is now
+            scanned = None
+            old = previous.get(port.port)
+            if old is not None and old['fingerprint'] == fingerprint:
+                count = self.dbmanager.vulnerability_carry_forward(self.id_scan, id_previous, port.port)
+                self.report.printer("Port "+port.port+" is unchanged, copied "+str(count)+" findings of scan #"+str(id_previous))
+                scanned = old['scanned']
+            else:
+                self.submit_port(port)
+            self.port_rows.append(fingerprint + (scanned,))
+
+    #get the ports of the previous scan that are recent enough to be reused
+    def get_previous_ports(self):
+        if not self.incremental:
+            return None, {}
+        id_previous = self.dbmanager.scan_previous_get(self.url, self.profile, self.id_scan)
+        if id_previous is None:
+            return None, {}
+        ports = {}
+        max_age = conf.get_config('incremental_max_age')
+        for row in self.dbmanager.scan_ports_get(id_previous):
+            #force a full scan of the port when its findings are too old
+            if row[6] is None or row[7] > max_age:
+                continue
+            ports[row[0]] = {'fingerprint': tuple(row[0:5]) + (bool(row[5]),), 'scanned': row[6]}
+        return id_previous, ports
+
+#ranges are scanned with one portscan for all hosts, for example 10.0.0.0/24 or 10.0.0.1-20
+def is_range(target):
+    if re.match(r"^[\w\.\-:]+/\d+$", target):
+        return True
+    return re.match(r"^[\d\.\-,]+$", target) is not None and re.search(r"[\-,]", target) is not None
+
+#portscan hosts and ranges together with one RangePortscan
+#returns (target, (results, ports)) for every host with open ports and for every
+#target that is not a range and has no open ports, those still get the general clip
+def range_portscan(targets):
+    save_path = create_dir()
+    try:
+        portscanner = RangePortscan([escapeshellarg(target) for target in targets], save_path)
+        hosts = portscanner.fire_scan()
+    finally:
+        shutil.rmtree(save_path, True)
+    print "Found "+str(len(hosts))+" hosts with open ports"
+    #every host gets its own scan, with the ports of the shared portscan
+    results = portscanner.get_results()
+    scans = [(host, (results, ports)) for host, ports in hosts]
+    found = set(host.lower() for host, ports in hosts)
+    for target in targets:
+        if not is_range(target) and target.lower() not in found:
+            found.add(target.lower())
+            scans.append((target, (results, [])))
+    return scans
+
+#scan one target of the job queue or the mass daemon, returns the id of the (last) scan
+#a range gets one portscan and a scan of every host with open ports
+def scan_target(target, bullet_file = None, id_mass = None):
+    if not is_range(target):
+        return Scan(escapeshellarg(target), bullet_file, id_mass).run()
+    #a bullet file runs on one host, the hosts of a range are only known after a portscan
+    if bullet_file is not None:
+        raise ValueError(target+" is a range, ranges can only be scanned without a bullet file")
+    id_scan = None
+    for host, portscan in range_portscan([target]):
+        id_scan = Scan(escapeshellarg(host), None, id_mass, None, None, portscan).run()
+    return id_scan
+
+def escapeshellarg(arg):
+    return "\\'".join("'" + p + "'" for p in arg.split("'"))
+
+#create_dir() creates a dir that is used to store tmp files for scanners
+#after the scan is finished, RPTR will try to remove this folder.
+def create_dir():
+    #generate random name
+    m = md5.new()
+    m.update(os.urandom(1337))
+    random_hash = str(m.hexdigest())
+    random_folder = "/tmp/"+random_hash
+
+    if not os.path.exists(random_folder):
+        #create folder
+        os.makedirs(random_folder)
+        #return path of folder for later use
+        return random_folder
+    #Is this the real life or is this just fantasy?
+    else:
+        return create_dir()
@@ -0,0 +1,217 @@
+#-------------------------------------------------------------------------------
+# Name:        RPTR scheduler
+# Purpose:     Keep the rifles busy, but not too busy
+#
+# Author:      John de Kroon
+#
+# Created:     18-10-2026
+# Copyright:   (c) John de Kroon 2016
+# Version:     1.0
+#-------------------------------------------------------------------------------
+
+import os
+import threading
+import conf
+from clip import *
+from rifle import *
+from hound import *
+from cache import *
+from profiler import *
+
+class Slots():
+    'limits how many bullets are fired at the same time'
+
+    def __init__(self, max_bullets, tool_limits):
+        self.slots = threading.BoundedSemaphore(max_bullets)
+        self.tool_slots = {}
+        for tool in tool_limits:
+            self.tool_slots[tool] = threading.BoundedSemaphore(tool_limits[tool])
+
+    def acquire(self, tool):
+        #wait for the tool first, so a queued nikto doesn't take a slot another tool could use
+        if tool in self.tool_slots:
+            self.tool_slots[tool].acquire()
+        self.slots.acquire()
+
+    def release(self, tool):
+        self.slots.release()
+        if tool in self.tool_slots:
+            self.tool_slots[tool].release()
+
+#the limits are shared by every scan in the process
+slots = None
+slots_lock = threading.Lock()
+
+def get_slots():
+    global slots
+    with slots_lock:
+        if slots is None:
+            slots = Slots(conf.get_config('max_bullets'), conf.get_config('tool_limits'))
+    return slots
+
+class Scheduler():
+    'runs the clips of a scan side by side'
+
+    def __init__(self, id_scan, url, save_path):
+        self.id_scan = id_scan
+        self.url = url
+        self.save_path = save_path
+        self.slots = get_slots()
+        self.cache = Cache(id_scan, save_path)
+        self.profiler = get_profiler()
+        self.loots = []
+        #(bullet file, prepared commands) -> origins of the clips started by loots
+        #the same commands run once per scan, the other ports that found them are recorded
+        self.started = {}
+        #number of clips that are not finished yet
+        self.pending = 0
+        self.done = threading.Condition()
+
+    #read the clip and fire its bullets, returns False if the bullet file is invalid
+    #origin is the port the tool logs are saved with, recursive clips get the port of their parent
+    def submit(self, bullet_file, port=None, origin=None):
+        if origin == None:
+            origin = port
+        clip = self.read_clip(bullet_file, port)
+        if clip is None:
+            return False
+        self.run_clip(clip, origin)
+        return True
+
+    #read a clip and prepare its bullets, returns None if the bullet file is invalid
+    def read_clip(self, bullet_file, port=None):
+        clip = Clip(bullet_file)
+        if port != None:
+            clip.setPort(port)
+        clip.setSavePath(self.save_path)
+        #if the bullet file doesn't exist or is invalid, just skip it
+        with self.profiler.span(bullet_file, "clip"):
+            if clip.read_bullet(self.url) == False:
+                return None
+        return clip
+
+    def run_clip(self, clip, origin):
+        bullets = clip.get_bullets()
+        #failed bullets keep an empty result, so the output still lines up with the bullets
+        state = {'clip': clip, 'origin': origin, 'output': [{'id': None, 'output': ""} for x in bullets], 'matches': [[] for x in bullets], 'finished': [False for x in bullets], 'fired': [False for x in bullets], 'left': len(bullets)}
+        with self.done:
+            self.pending += 1
+            #bullets that wait for nothing start right away, the others when the bullets they wait for are finished
+            ready = self.get_ready(state)
+        if len(bullets) == 0:
+            self.finish(state)
+        self.start(state, ready)
+
+    #start a clip that a loot found, unless the same commands were started already in this scan
+    #the tool logs get the origin of the first port that found the clip
+    def submit_loot(self, bullet_file, origin):
+        clip = self.read_clip(bullet_file)
+        if clip is None:
+            return False
+        key = (bullet_file, tuple(clip.get_bullets()))
+        added = False
+        with self.done:
+            origins = self.started.get(key)
+            if origins is None:
+                self.started[key] = [origin]
+            elif origin not in origins:
+                origins.append(origin)
+                added = True
+        if origins is not None:
+            if added:
+                print "Clip "+bullet_file+" already runs for port "+str(origins[0])+", port "+str(origin)+" found it too"
+            return False
+        self.run_clip(clip, origin)
+        return True
+
+    def start(self, state, indexes):
+        for x in indexes:
+            t = threading.Thread(target=self.fire, args=(state, x))
+            t.daemon = True
+            t.start()
+
+    #the bullets that can start, call with the lock held
+    def get_ready(self, state):
+        clip = state['clip']
+        ready = []
+        for x in range(0, len(state['fired'])):
+            if state['fired'][x]:
+                continue
+            if all(state['finished'][y] for y in clip.get_after(x)):
+                state['fired'][x] = True
+                ready.append(x)
+        return ready
+
+    def fire(self, state, x):
+        clip = state['clip']
+        bullet = clip.get_bullets()[x]
+        tool = get_tool_name(bullet)
+        try:
+            #reuse the output of a recent run, if the bullet allows it
+            with self.profiler.span(tool, "cache"):
+                result = self.cache.get(bullet, clip.get_ttl(x), state['origin'])
+            if result is not None:
+                print "Cached: "+bullet
+            else:
+                #time waiting for a free slot and time running the tool are recorded apart
+                with self.profiler.span(tool, "queue"):
+                    self.slots.acquire(tool)
+                try:
+                    print "Firing: "+bullet
+                    with self.profiler.span(tool, "tool", command=bullet) as span:
+                        result = Rifle(self.id_scan, bullet, clip.get_timeout(x), get_cache_key(bullet, self.save_path), state['origin']).get_result()
+                        span.args['bytes'] = result['size']
+                        span.args['status'] = result['status']
+                finally:
+                    self.slots.release(tool)
+            #the rifle hands over the output, only ask the hound if it didn't
+            if result is None:
+                with self.profiler.span(tool, "hound"):
+                    result = Hound(self.id_scan).loot_get(bullet)
+            state['output'][x] = result
+            try:
+                #match the loots now, so their clips don't wait for the slowest bullet of this clip
+                results, clips = clip.match_bullet(x, result)
+            finally:
+                #remove the temp files of large output
+                if 'capture' in result:
+                    result['capture'].close()
+            state['matches'][x] = results
+            for new_clip in clips:
+                self.submit_loot(new_clip, state['origin'])
+        finally:
+            with self.done:
+                state['finished'][x] = True
+                state['left'] -= 1
+                last = state['left'] == 0
+                ready = self.get_ready(state)
+            self.start(state, ready)
+            #the last bullet of the clip saves the results
+            if last:
+                self.finish(state)
+
+    def finish(self, state):
+        try:
+            #save loot (clip converts bullet output to vulnerabilities)
+            result_list = []
+            for results in state['matches']:
+                result_list.extend(results)
+            self.save_loot(state['clip'].group_results(result_list))
+        finally:
+            with self.done:
+                self.pending -= 1
+                self.done.notify_all()
+
+    def save_loot(self, loot):
+        with self.done:
+            self.loots.append(loot)
+
+    #wait until every clip, including the recursive ones, is finished
+    def join(self):
+        with self.done:
+            while self.pending > 0:
+                #wait with a timeout, otherwise ctrl+c is ignored
+                self.done.wait(1)
+
+    def get_loots(self):
+        return self.loots
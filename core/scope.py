@@ -0,0 +1,92 @@
+#-------------------------------------------------------------------------------
+# Name:        RPTR scope
+# Purpose:     Spot all loots in one look
+#
+# Author:      John de Kroon
+#
+# Created:     18-10-2026
+# Copyright:   (c) John de Kroon 2016
+# Version:     1.0
+#-------------------------------------------------------------------------------
+
+import re
+import sre_parse
+import sre_constants
+from profiler import get_profiler
+
+#prefixes shorter than this give too many candidates, those loots are searched the normal way
+MIN_PREFIX = 3
+
+class Scope():
+    'finds the first match of every loot of a bullet in a single pass'
+
+    def __init__(self, loots):
+        self.loots = loots
+        #loot indexes that can't be anchored on a literal prefix
+        self.fallback = []
+        #prefix -> loot indexes that start with exactly that prefix
+        self.groups = {}
+        for x in range(0, len(loots)):
+            prefix = literal_prefix(loots[x].regex)
+            if len(prefix) < MIN_PREFIX:
+                self.fallback.append(x)
+            else:
+                self.groups.setdefault(prefix, []).append(x)
+        #a prefix that is the start of another prefix would be hit on every occurrence of
+        #the longer one (like '<item id="' in nikto output), search those loots the normal way
+        for prefix in self.groups.keys():
+            for other in self.groups:
+                if other != prefix and other.startswith(prefix):
+                    self.fallback.extend(self.groups.pop(prefix))
+                    break
+        self.fallback.sort()
+        #one pattern that finds every prefix, so the output is only scanned once
+        self.scanner = None
+        if self.groups:
+            self.scanner = re.compile("|".join(re.escape(prefix) for prefix in self.groups))
+
+    #returns a list with the first match (like re.search) for every loot, or None
+    def scan(self, output):
+        matches = [None] * len(self.loots)
+        profiler = get_profiler()
+        for x in self.fallback:
+            #the time of the loots in the combined pass can't be told apart, these can
+            with profiler.span(self.loots[x].regex.pattern[:80], "loot"):
+                matches[x] = self.loots[x].regex.search(output)
+        if self.scanner is None:
+            return matches
+        pending = dict((prefix, list(indexes)) for prefix, indexes in self.groups.items())
+        hit = self.scanner.search(output)
+        while hit is not None:
+            pos = hit.start()
+            indexes = pending.get(hit.group(0))
+            if indexes:
+                for x in list(indexes):
+                    #every match starts with the prefix, so the first offset that
+                    #matches is the same match re.search would have found
+                    searchObj = self.loots[x].regex.match(output, pos)
+                    if searchObj:
+                        matches[x] = searchObj
+                        indexes.remove(x)
+                if not indexes:
+                    del pending[hit.group(0)]
+                    if not pending:
+                        break
+            #prefixes can overlap, so continue right after the start of this hit
+            hit = self.scanner.search(output, pos+1)
+        return matches
+
+#get the literal text every match of the regex has to start with
+def literal_prefix(regex):
+    if regex.flags & (re.IGNORECASE | re.LOCALE):
+        return ""
+    prefix = []
+    try:
+        parsed = sre_parse.parse(regex.pattern, regex.flags)
+    except (sre_constants.error, TypeError):
+        return ""
+    for op, av in parsed:
+        if op != sre_constants.LITERAL or av > 255:
+            break
+        prefix.append(chr(av))
+    return "".join(prefix)
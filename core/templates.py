@@ -0,0 +1,96 @@
+#-------------------------------------------------------------------------------
+# Name:        RPTR templates
+# Purpose:     Keeps the report templates loaded
+#
+# Author:      John de Kroon
+#
+# Created:     18-10-2026
+# Copyright:   (c) John de Kroon 2016
+# Version:     1.0
+#-------------------------------------------------------------------------------
+
+import os
+import threading
+import xml.etree.ElementTree as ET
+from collections import namedtuple
+import conf
+
+#read only form of a template file, the templates are indexed by id
+TemplateFile = namedtuple('TemplateFile', ['name', 'mtime', 'templates'])
+Template = namedtuple('Template', ['id', 'title', 'description', 'chance', 'chance_desc', 'impact', 'impact_desc', 'risk', 'recommendation'])
+
+class Templates():
+    'reads every template file (language) once and keeps it loaded'
+
+    def __init__(self, templates_dir = None):
+        if templates_dir == None:
+            templates_dir = conf.get_config('templates_dir')
+        self.templates_dir = templates_dir
+        self.files = {}
+        self.lock = threading.Lock()
+
+    #get the templates of a file, returns None if the file is invalid or not found
+    def get_file(self, file_name):
+        with self.lock:
+            try:
+                mtime = os.stat(self.templates_dir + file_name).st_mtime
+            except OSError:
+                self.files.pop(file_name, None)
+                return None
+            template_file = self.files.get(file_name)
+            #the file changed on disk (or was never seen), read it again
+            if template_file is None or template_file.mtime != mtime:
+                template_file = self.reload(file_name)
+            return template_file
+
+    def reload(self, file_name):
+        try:
+            template_file = self.compile(file_name)
+        except (IOError, OSError, ET.ParseError) as e:
+            print " ! Warning: the template file "+file_name+" is invalid: "+str(e)
+            template_file = None
+        if template_file is None:
+            self.files.pop(file_name, None)
+        else:
+            self.files[file_name] = template_file
+        return template_file
+
+    def compile(self, file_name):
+        path = self.templates_dir + file_name
+        mtime = os.stat(path).st_mtime
+        templates = {}
+        for element in ET.parse(path).getroot().iter('template'):
+            id = element.findtext('id')
+            #templates without an id or title can't be found
+            if id is None or element.find('title') is None:
+                continue
+            id = id.strip()
+            #the first template with an id wins, like the old lookup
+            if id in templates:
+                continue
+            templates[id] = Template(id, *[element.findtext(field) for field in Template._fields[1:]])
+        return TemplateFile(file_name, mtime, templates)
+
+    #get the template of a finding, the fallback files are searched when the file doesn't have it
+    def get(self, id, file_name = None):
+        if file_name == None:
+            file_name = conf.get_config('default_template')
+        for name in [file_name] + conf.get_config('fallback_templates'):
+            template_file = self.get_file(name)
+            if template_file is not None and str(id) in template_file.templates:
+                return template_file.templates[str(id)]
+        return None
+
+#one template store per process
+templates = None
+templates_lock = threading.Lock()
+
+def get_templates():
+    global templates
+    with templates_lock:
+        if templates is None:
+            templates = Templates()
+    return templates
+
+def get_template(id, file_name = None):
+    return get_templates().get(id, file_name)
@@ -0,0 +1,117 @@
+#-------------------------------------------------------------------------------
+# Name:        RPTR worker
+# Purpose:     Share the scans between hosts
+#
+# Author:      John de Kroon
+#
+# Created:     18-10-2026
+# Copyright:   (c) John de Kroon 2016
+# Version:     1.0
+#-------------------------------------------------------------------------------
+
+import os
+import time
+import uuid
+import socket
+import threading
+import conf
+from dbmanager import *
+from scan import *
+
+#put targets in the job queue, the targets are inserted in batches
+def enqueue(targets, bullet_file = None, id_mass = None):
+    dbmanager = Dbmanager()
+    count = 0
+    rows = []
+    for target in targets:
+        rows.append((target, bullet_file, id_mass))
+        if len(rows) >= 500:
+            count += dbmanager.job_create_many(rows)
+            rows = []
+    count += dbmanager.job_create_many(rows)
+    return count
+
+class Worker():
+    'takes scans from the job queue, on this or any other host'
+
+    def __init__(self, parallel = None):
+        if parallel == None:
+            parallel = conf.get_config('worker_parallel')
+        self.parallel = parallel
+        #the name of the worker in the jobs table
+        self.name = socket.gethostname()+":"+str(os.getpid())
+        self.lease = conf.get_config('worker_lease')
+        self.dbmanager = Dbmanager()
+        #(id, claim, state, id_scan) of jobs that could not be finished, the heartbeat tries again
+        self.unfinished = []
+        self.lock = threading.Lock()
+
+    def run(self):
+        print "Worker "+self.name+" started"
+        t = threading.Thread(target=self.heartbeat)
+        t.daemon = True
+        t.start()
+        threads = []
+        for x in range(0, self.parallel):
+            t = threading.Thread(target=self.work)
+            t.daemon = True
+            t.start()
+            threads.append(t)
+        for t in threads:
+            #join with a timeout, otherwise ctrl+c is ignored
+            while t.is_alive():
+                t.join(1)
+
+    #keep the leases of the running jobs alive, jobs of a dead worker expire
+    def heartbeat(self):
+        while True:
+            time.sleep(self.lease / 3)
+            self.finish_unfinished()
+            try:
+                self.dbmanager.job_heartbeat(self.name, self.lease)
+            except MySQLdb.Error as e:
+                print " ! Error: heartbeat failed: "+str(e)
+
+    #mark a job as done or failed, if the database is gone the heartbeat tries again later
+    #(the heartbeat keeps the lease of the job, so it would never be queued again)
+    def finish(self, job):
+        try:
+            self.dbmanager.job_finish(*job)
+        except Exception as e:
+            print " ! Error: could not finish job #"+str(job[0])+": "+str(e)
+            with self.lock:
+                self.unfinished.append(job)
+
+    def finish_unfinished(self):
+        with self.lock:
+            jobs = self.unfinished
+            self.unfinished = []
+        for job in jobs:
+            self.finish(job)
+
+    def work(self):
+        while True:
+            claim = uuid.uuid4().hex
+            try:
+                #every worker puts the jobs of dead workers back in the queue
+                count = self.dbmanager.job_requeue_expired(conf.get_config('worker_max_attempts'))
+                if count > 0:
+                    print "Queued "+str(count)+" jobs of stopped workers again"
+                job = self.dbmanager.job_claim(self.name, claim, self.lease)
+            except MySQLdb.Error as e:
+                #the database is gone for a moment, try again later
+                print " ! Error: claiming a job failed: "+str(e)
+                job = None
+            if job is None:
+                time.sleep(conf.get_config('worker_poll'))
+                continue
+            id, target, bullet, id_mass = job
+            state = "done"
+            id_scan = None
+            try:
+                id_scan = scan_target(target, bullet, id_mass)
+            except Exception as e:
+                state = "failed"
+                print " ! Error: scan on "+target+" failed: "+str(e)
+            finally:
+                self.finish((id, claim, state, id_scan))
@@ -0,0 +1,10 @@
+-- Indexes for the report, list and hound queries
+
+-- tool is a mediumtext and can't be indexed, store a SHA1 of the command next to it
+ALTER TABLE `tool_log` ADD `tool_hash` char(40) CHARACTER SET ascii NOT NULL DEFAULT '' AFTER `tool`;
+UPDATE `tool_log` SET `tool_hash` = SHA1(`tool`);
+ALTER TABLE `tool_log` ADD INDEX `id_scan_tool_hash` (`id_scan`, `tool_hash`);
+
+ALTER TABLE `vulnerabilities` ADD INDEX `id_scan` (`id_scan`), ADD INDEX `id_tool_log` (`id_tool_log`);
+
+ALTER TABLE `scan` ADD INDEX `id_mass_target` (`id_mass`, `target`);
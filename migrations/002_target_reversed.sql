@@ -0,0 +1,5 @@
+-- Reversed target, so searching for a domain (and its subdomains) is a prefix search on an index
+
+ALTER TABLE `scan` ADD `target_reversed` varchar(300) CHARACTER SET latin1 NOT NULL DEFAULT '' AFTER `target`;
+UPDATE `scan` SET `target_reversed` = REVERSE(TRIM(BOTH "'" FROM `target`));
+ALTER TABLE `scan` ADD INDEX `target_reversed` (`target_reversed`);
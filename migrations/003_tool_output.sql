@@ -0,0 +1,15 @@
+-- Store tool output compressed and out of row, identical output is stored once
+
+CREATE TABLE IF NOT EXISTS `tool_output` (
+  `hash` char(40) CHARACTER SET ascii NOT NULL,
+  `size` int(11) NOT NULL,
+  `data` longblob NOT NULL,
+  `timestamp` timestamp NOT NULL DEFAULT CURRENT_TIMESTAMP,
+  PRIMARY KEY (`hash`)
+) ENGINE=InnoDB  DEFAULT CHARSET=utf8;
+
+ALTER TABLE `tool_log` ADD `output_hash` char(40) CHARACTER SET ascii DEFAULT NULL AFTER `output`, ADD `output_size` int(11) DEFAULT NULL AFTER `output_hash`;
+
+-- move the existing output, COMPRESS() uses the same format as RPTR
+INSERT IGNORE INTO `tool_output` (`hash`, `size`, `data`) SELECT SHA1(`output`), LENGTH(`output`), COMPRESS(`output`) FROM `tool_log` WHERE `output_hash` IS NULL;
+UPDATE `tool_log` SET `output_hash` = SHA1(`output`), `output_size` = LENGTH(`output`), `output` = '' WHERE `output_hash` IS NULL;
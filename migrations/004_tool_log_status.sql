@@ -0,0 +1,3 @@
+-- Status and exit code of the tool: done, timeout (killed, the output is partial) or truncated (the output is cut off)
+
+ALTER TABLE `tool_log` ADD `status` varchar(10) CHARACTER SET ascii NOT NULL DEFAULT 'done' AFTER `exec_time`, ADD `exit_code` int(11) DEFAULT NULL AFTER `status`;
@@ -0,0 +1,4 @@
+-- Cache key of the tool: the SHA1 of the command without the temp dir of the scan
+
+ALTER TABLE `tool_log` ADD `cache_key` char(40) CHARACTER SET ascii DEFAULT NULL AFTER `tool_hash`;
+ALTER TABLE `tool_log` ADD INDEX `cache_key_timestamp` (`cache_key`, `timestamp`);
@@ -0,0 +1,20 @@
+-- Open ports of every scan, used to skip unchanged services in incremental scans
+
+CREATE TABLE IF NOT EXISTS `scan_ports` (
+  `id` int(11) NOT NULL AUTO_INCREMENT,
+  `id_scan` int(11) NOT NULL,
+  `port` varchar(10) NOT NULL,
+  `service` varchar(50) DEFAULT NULL,
+  `product` varchar(255) DEFAULT NULL,
+  `version` varchar(255) DEFAULT NULL,
+  `tunnel` varchar(10) DEFAULT NULL,
+  `duplicate` tinyint(1) NOT NULL DEFAULT '0',
+  `scanned` timestamp NULL DEFAULT NULL,
+  PRIMARY KEY (`id`),
+  KEY `id_scan` (`id_scan`)
+) ENGINE=InnoDB  DEFAULT CHARSET=utf8;
+
+-- port of the clip the tool ran for, NULL for the general clip and the portscan
+ALTER TABLE `tool_log` ADD `port` varchar(10) DEFAULT NULL AFTER `id_scan`;
+
+ALTER TABLE `scan` ADD INDEX `target_reversed_profile` (`target_reversed`, `profile`);
@@ -0,0 +1,19 @@
+-- Mass scan schedule: one mass row per type and period, one job per target in that period
+
+ALTER TABLE `mass` ADD `period_start` datetime DEFAULT NULL AFTER `type`;
+ALTER TABLE `mass` ADD UNIQUE INDEX `type_period_start` (`type`, `period_start`);
+
+CREATE TABLE IF NOT EXISTS `mass_jobs` (
+  `id` int(11) NOT NULL AUTO_INCREMENT,
+  `id_mass` int(11) NOT NULL,
+  `id_target` int(11) NOT NULL,
+  `bullet` varchar(50) NOT NULL,
+  `due` datetime NOT NULL,
+  `state` varchar(10) CHARACTER SET ascii NOT NULL DEFAULT 'queued',
+  `id_scan` int(11) DEFAULT NULL,
+  `started` datetime DEFAULT NULL,
+  `finished` datetime DEFAULT NULL,
+  PRIMARY KEY (`id`),
+  UNIQUE KEY `id_mass_id_target` (`id_mass`, `id_target`),
+  KEY `state_due` (`state`, `due`)
+) ENGINE=InnoDB  DEFAULT CHARSET=utf8;
@@ -0,0 +1,22 @@
+-- Job queue for distributed workers (rptr.py --enqueue and rptr.py --worker)
+
+CREATE TABLE IF NOT EXISTS `jobs` (
+  `id` int(11) NOT NULL AUTO_INCREMENT,
+  `target` varchar(500) NOT NULL,
+  `bullet` varchar(50) DEFAULT NULL,
+  `id_mass` int(11) DEFAULT NULL,
+  `state` varchar(10) CHARACTER SET ascii NOT NULL DEFAULT 'queued',
+  `worker` varchar(100) DEFAULT NULL,
+  `claim` char(32) CHARACTER SET ascii DEFAULT NULL,
+  `attempts` int(11) NOT NULL DEFAULT '0',
+  `lease_until` datetime DEFAULT NULL,
+  `heartbeat` datetime DEFAULT NULL,
+  `id_scan` int(11) DEFAULT NULL,
+  `created` timestamp NOT NULL DEFAULT CURRENT_TIMESTAMP,
+  `started` datetime DEFAULT NULL,
+  `finished` datetime DEFAULT NULL,
+  PRIMARY KEY (`id`),
+  KEY `state_id` (`state`, `id`),
+  KEY `state_lease_until` (`state`, `lease_until`),
+  KEY `claim` (`claim`)
+) ENGINE=InnoDB  DEFAULT CHARSET=utf8;
@@ -0,0 +1,3 @@
+-- Status of the scan: done or failed (the scan stopped with an error, its findings are incomplete)
+
+ALTER TABLE `scan` ADD `status` varchar(10) CHARACTER SET ascii NOT NULL DEFAULT 'done' AFTER `exec_time`;
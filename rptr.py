@@ -16,8 +16,10 @@ import json
 import time
 import os
 import threading
-import md5
+import Queue
 import shutil
+import sys
+from contextlib import contextmanager
 
 from core.report import *
 from core.clip import *
@@ -26,6 +28,11 @@ from core.rifle import *
 from core.dbmanager import *
 from core.mass import *
 from core.portscan import *
+from core.scheduler import *
+from core.scan import *
+from core.migrate import *
+from core.profiler import *
+from core.worker import *
 
 import conf
 
@@ -34,21 +41,40 @@ RPTR aims to orchestrate and interpret your tooling.
 
 Example: rptr.py 192.168.1.1""")
 parser.add_argument('--json', help="Output result in JSON string", action="store_true")
-parser.add_argument('--list-tests', help="Get a list of test performed on the target. Usage: --list-test test.nl")
+parser.add_argument('--ndjson', help="Output result as one JSON object per finding, per line", action="store_true")
+parser.add_argument('-o', help="Write the JSON report to a file instead of stdout")
+parser.add_argument('--limit', type=int, help="Maximum number of findings in the report")
+parser.add_argument('--offset', type=int, help="Skip this many findings of the report")
+parser.add_argument('--target', help="Only report the findings of this domain (and its subdomains) or IP")
+parser.add_argument('--list-tests', help="Get a list of test performed on the target. Usage: --list-test test.nl, or --list-test '*test*' to search for any text (slow)")
 parser.add_argument('-b', help="Bullet file from the bullet dir")
+parser.add_argument('--template', help="Template file (language) from the templates dir for the report, for example nl_template.xml")
 parser.add_argument('-r', help="Get a report from the database. Usage: -r 14, where 14 is the report id")
+parser.add_argument('--max-bullets', type=int, help="Maximum number of tools that run at the same time")
+parser.add_argument('--parallel', type=int, help="Number of targets that are scanned at the same time (default 1, --mass-daemon and --worker use mass_parallel and worker_parallel from conf.py)")
+parser.add_argument('-iL', dest='input_list', help="File with targets to scan, one per line")
 parser.add_argument('-l', help="List vulnerabilities from mass scan from the database. Usage: -l 14, where 14 is the mass scan report id")
+parser.add_argument('--no-cache', help="Run every tool, don't reuse output of earlier scans", action="store_true")
+parser.add_argument('--portscan', choices=sorted(conf.get_config('portscan_profiles').keys()), help="Portscan profile from conf.py, for example full for all ports")
+parser.add_argument('--incremental', help="Skip services that didn't change since the previous scan of the target", action="store_true")
+parser.add_argument('--mass-daemon', help="Keep running and scan the targets in the targets table when they are due", action="store_true")
+parser.add_argument('--enqueue', help="Put the targets in the job queue, for the workers", action="store_true")
+parser.add_argument('--worker', help="Keep running and scan the targets in the job queue", action="store_true")
+parser.add_argument('--replay', help="Don't run the tools, use the recorded output in the fixtures dir (for testing)", action="store_true")
+parser.add_argument('--record-portscan', help="Save the xml of the portscan in the fixtures dir (fixtures/nmap.xml)", action="store_true")
+parser.add_argument('--profile', help="Print where the time of the scan went", action="store_true")
+parser.add_argument('--trace', help="Write a trace of the scan to a file, open it in chrome://tracing")
+parser.add_argument('--migrate', help="Update the database schema to the latest version", action="store_true")
 parser.add_argument('URL', nargs='*', help='URL or IP address to scan')
 
 args = parser.parse_args()
 
+if args.parallel is not None and args.parallel < 1:
+    parser.error("--parallel must be 1 or more")
+
 verbose = True
-id_scan = 0
 report = None
 id_mass = None
-loots = []
-threads = []
-save_path = None
 
 #if b arg is present, use supplied bullet. 
 if(args.b):
@@ -57,150 +83,174 @@ if(args.b):
 else:
     bullet_file = None
 
-if(args.json):
+if args.json or args.ndjson:
     verbose = False
-    
-dbmanager = Dbmanager()
 
-def start_rptr(url):
+if args.no_cache:
+    conf.set_config('cache', False)
+
+if args.incremental:
+    conf.set_config('incremental', True)
+
+if args.portscan:
+    conf.set_config('portscan_profile', args.portscan)
+
+if args.template:
+    conf.set_config('default_template', args.template)
+
+if args.replay:
+    conf.set_config('replay', True)
+
+if args.record_portscan:
+    conf.set_config('record_portscan', True)
+
+if args.profile:
+    conf.set_config('profile', True)
+
+if args.trace:
+    conf.set_config('trace_file', args.trace)
+
+if args.max_bullets:
+    conf.set_config('max_bullets', args.max_bullets)
+    
+def start_rptr(url, portscan = None):
     global bullet_file
-    global dbmanager
-    global id_scan
     global id_mass
-    global save_path
-    global report
-    
-    profile = bullet_file
-    if profile == None:
-        profile = "Default"
-    
-    id_scan = dbmanager.test_create(url, id_mass, profile)
-    report = Report(id_scan)
-    report.set_verbose(True)
-    
-    report.printer("Start scan #"+str(id_scan)+" on "+url+"...")
-    report.printer("Created DB entry. Scan ID is "+str(id_scan))
-    
-    start = time.time()
-    save_path = create_dir()
-    print save_path
-    
-    if bullet_file == None:
-        portscanner = Portscan(id_scan, url, save_path)
-        portscanner.fire_scan()
-        ports = portscanner.get_ports()
-        print ports
-        get_clip("general")
-        for port in ports:
-            #skip duplicate functions (like 80 and 443)
-            if port['duplicate'] == False:
-                get_clip(port['service'], port['port'])
-            if port['tunnel'] == 'ssl' and port['service'] == "https":
-                get_clip(port['tunnel'], port['port'])
-    else:
-        get_clip(bullet_file)
-    report.print_results(loots)
-    exec_time = time.strftime("%H:%M:%S", time.gmtime((time.time() - start)))
-    shutil.rmtree(save_path)
-    report.printer("done")
-    dbmanager.test_update_time(id_scan, exec_time)
     
-def get_clip(bullet_file, port=None):
-    global save_path
-    #init list for the output
-    output = []
-    #get new clip
-    clip = Clip(bullet_file)
-    #set params
-    if port != None:
-        clip.setPort(port)
-    clip.setSavePath(save_path)
+    #every scan has its own state, so targets can run at the same time
+    scan = Scan(url, bullet_file, id_mass, None, None, portscan)
+    return scan.run()
+
+#read targets from the command line and the target file
+#the target file is read line by line, so big lists are never loaded at once
+def get_targets():
+    for url in read_targets():
+        #a bullet file runs on one host, the hosts of a range are only known after a portscan
+        if bullet_file is not None and is_range(url):
+            print " ! Error: "+url+" is a range, ranges can only be scanned without -b"
+            continue
+        yield url
+
+def read_targets():
+    for url in args.URL:
+        yield url
+    if args.input_list:
+        with open(args.input_list) as f:
+            for line in f:
+                line = line.strip()
+                #skip empty lines and comments
+                if line == "" or line.startswith("#"):
+                    continue
+                yield line
+
+#targets is a list of (url, portscan), portscan is None when the scan runs its own portscan
+def scan_targets(targets, parallel):
+    #small queue, the target list is only read as fast as the targets are scanned
+    queue = Queue.Queue(parallel)
+    workers = []
     
-    #read bullet file
-    #if the bullet file doesn't exist or is invalid, just skip it
-    if clip.read_bullet(url) == False:
-        return False
-    #get commands to execute from clip
-    #bullets contains list with tools to execute
-    bullets = clip.get_bullets()
-    #list with all active threads
-    threads = []
+    def worker():
+        while True:
+            target = queue.get()
+            if target is None:
+                break
+            url, portscan = target
+            try:
+                start_rptr(escapeshellarg(url), portscan)
+            except Exception as e:
+                print " ! Error: scan on "+url+" failed: "+str(e)
     
-    #loop through bullets (tools)
-    for x in bullets:
-        #start new thread to fire bullet
-        t = threading.Thread(target=fire, args=(x,))
-        #add new thread to the tread list, at this point, thread is not started yet
-        threads.append({"bullet": x, "thread": t})
-        #start the thread
+    for x in range(0, parallel):
+        t = threading.Thread(target=worker)
+        t.daemon = True
         t.start()
-    
-    for t in threads:
-        #new hound
-        hound = Hound(id_scan)
-        print "Waiting for: "+t['bullet']
-        #wait for thread to finish
-        t['thread'].join()
-        #get results with hound
-        bullet_result = hound.loot_get(t['bullet'])
-        #add the results to list
-        output.append(bullet_result)
-    
-    #save loot (clip converts bullet output to vulnerabilities)
-    save_loot(clip.process_results(output))
-    #get recursive files
-    new_clips = clip.get_clips()
-    for new_clip in new_clips:
-        get_clip(new_clip)
-    
-def save_loot(loot):
-    global loots
-    loots.append(loot)
-
-def fire(bullet):
-    global id_scan
-    return Rifle(id_scan, bullet)
-
-#create_dir() creates a dir that is used to store tmp files for scanners
-#after the scan is finished, RPTR will try to remove this folder.
-def create_dir():
-    #generate random name
-    m = md5.new()
-    m.update(os.urandom(1337))
-    random_hash = str(m.hexdigest())
-    random_folder = "/tmp/"+random_hash
-    
-    if not os.path.exists(random_folder):
-        #create folder
-        os.makedirs(random_folder)
-        #return path of folder for later use
-        return random_folder
-    #Is this the real life or is this just fantasy?
+        workers.append(t)
+    for url in targets:
+        queue.put(url)
+    #one stop sign for every worker
+    for t in workers:
+        queue.put(None)
+    for t in workers:
+        #join with a timeout, otherwise ctrl+c is ignored
+        while t.is_alive():
+            t.join(1)
+
+#the JSON reports go to the -o file or to stdout
+@contextmanager
+def get_output():
+    if args.o:
+        with open(args.o, "w") as f:
+            yield f
     else:
-        return create_dir()
+        yield sys.stdout
+
+#without a bullet file, the targets share one portscan per portscan_hosts targets
+def scan_batches(targets, parallel):
+    batch = []
+    for target in targets:
+        batch.append(target)
+        if len(batch) >= conf.get_config('portscan_hosts'):
+            scan_batch(batch, parallel)
+            batch = []
+    if len(batch) > 0:
+        scan_batch(batch, parallel)
 
-def escapeshellarg(arg):
-    return "\\'".join("'" + p + "'" for p in arg.split("'"))
+def scan_batch(batch, parallel):
+    #a single host doesn't need a shared portscan
+    if len(batch) == 1 and not is_range(batch[0]):
+        scan_targets([(batch[0], None)], 1)
+        return
+    scan_targets(range_portscan(batch), parallel)
 
-if(args.r):
+if args.migrate:
+    Migrate().run()
+elif args.mass_daemon:
+    #None is mass_parallel from conf.py
+    Daemon(args.parallel).run()
+elif args.worker:
+    #None is worker_parallel from conf.py
+    Worker(args.parallel).run()
+elif(args.r):
     report = Report(args.r)
     report.set_verbose(verbose)
-    report.get_report()
+    if verbose and args.limit is None and args.offset is None and args.target is None:
+        report.get_report()
+    elif verbose:
+        #only a part of the findings, streamed like the JSON report
+        report.print_report(args.limit, args.offset, args.target)
+    else:
+        #the JSON report is written while it is read from the database
+        with get_output() as out:
+            report.write_report(out, args.ndjson, args.limit, args.offset, args.target)
 elif args.l:
     mass = Mass()
-    targets = mass.get_mass_report(args.l)
-    for target in targets:
-        print "Vulnerabilities for "+target+" ("+str(len(targets[target]))+")"
-        print
-        for vuln in targets[target]:
-            print str(vuln['id'])+": "+str(vuln['tool'])
-        print
+    if verbose:
+        mass.print_mass_report(args.l, args.limit, args.offset, args.target)
+    else:
+        with get_output() as out:
+            mass.write_mass_report(args.l, out, args.ndjson, args.limit, args.offset, args.target)
 if(args.list_tests):
     report = Report(args.r)
     print report.test_list_domain(args.list_tests)
-elif args.URL is None:
-    print "Please provide an URL. For help use rptr.py --help"
+elif not args.URL and not args.input_list:
+    if not args.r and not args.l and not args.migrate and not args.mass_daemon and not args.worker:
+        print "Please provide an URL. For help use rptr.py --help"
+elif args.enqueue:
+    #the workers scan the targets
+    print "Queued "+str(enqueue(get_targets(), bullet_file))+" targets"
+elif bullet_file is None:
+    #portscan the targets together, then scan the hosts that were found
+    scan_batches(get_targets(), args.parallel or 1)
+elif args.parallel > 1:
+    #start RPTR on multiple targets at the same time
+    scan_targets(((url, None) for url in get_targets()), args.parallel)
 else:
     #start RPTR
-    for url in args.URL:
+    for url in get_targets():
         start_rptr(escapeshellarg(url))
+
+if conf.get_config('trace_file') is not None:
+    get_profiler().export(conf.get_config('trace_file'))
+if conf.get_config('profile'):
+    print
+    get_profiler().print_summary()